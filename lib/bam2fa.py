@@ -4,10 +4,13 @@
 import os
 import re
 import sys
-import pysam
 import logging
 import argparse
 
+from seqio import open_bam, read_batches, open_output, encode_fasta
+from orient import read_orient_barcodes, orient_batch
+from runstats import phase, timed, count, add_stats_args, run_main
+
 LOG = logging.getLogger(__name__)
 
 __version__ = "1.0.0"
@@ -16,32 +19,35 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_bam(file):
+def bam2fa(file, threads=1, out=None, compress=None, orient=None):
 
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
+    with phase("open"):
+        fh = open_bam(file, threads)
+        fo = open_output(out, compress)
+    count(files=[file])
+    if orient:
+        orient = read_orient_barcodes(orient)
 
-    for line in fh:
-        #yield [line.qname, line.seq, pysam.array_to_qualitystring(line.query_qualities), line.get_tag('rq')]
-        yield line.qname, line.seq
+    for records in timed(read_batches(fh), size=len):
+        with phase("write"):
+            fo.write(encode_fasta(records, orient_batch(records, orient)))
 
+    fo.close()
     fh.close()
 
 
-def bam2fa(file):
-
-    for seqid, seq in read_bam(file):
-        print('>%s\n%s' % (seqid, seq))
-
-
 def add_hlep_args(parser):
 
     parser.add_argument('bam',
         help='Input reads file, format(bam and sam).')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam decompression, default=1.')
+    parser.add_argument('-o', '--out', metavar='FILE', type=str, default=None,
+        help='Output file, default=stdout.')
+    parser.add_argument('-c', '--compress', choices=["gzip", "bgzip"], default=None,
+        help='Compress the output with gzip or bgzip, default is no compression.')
+    parser.add_argument('--orient', metavar='FASTA', type=str, default=None,
+        help='Forward (5\') barcodes, reads of the reverse strand are reverse complemented.')
 
     return parser
 
@@ -60,14 +66,15 @@ name:
 
 attention:
     bam2fa.py input.bam >ouput.fa
+    bam2fa.py input.bam --compress gzip --out ouput.fa.gz
 
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    bam2fa(args.bam)
+    run_main(lambda: bam2fa(args.bam, args.threads, args.out, args.compress, args.orient), args, "bam2fa")
 
 
 if __name__ == "__main__":
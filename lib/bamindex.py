@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import os
+import gzip
+import struct
+import logging
+
+import collections
+import numpy as np
+
+from zmwindex import zmw_prefix, parse_zmw
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["ZmwOffsets", "read_pbi", "load_zmw_offsets", "write_zmw_offsets",
+    "index_records", "select_offsets", "seek_records", "range_records"]
+
+
+PBI_MAGIC = b"PBI\x01"
+PBI_HEADER = struct.Struct("<4sIHI18s")
+ZMW_INDEX_SUFFIX = ".zmi"
+
+# the virtual offset of the first record of every zmw in a bam file
+ZmwOffsets = collections.namedtuple("ZmwOffsets", ["movies", "movie", "hole", "offset"])
+
+
+def read_pbi(file):
+    '''Read rgId, holeNumber and fileOffset of the BasicData section of a PacBio .pbi'''
+
+    fp = gzip.open(file, "rb")
+    data = fp.read()
+    fp.close()
+
+    magic, version, flags, nreads, reserved = PBI_HEADER.unpack_from(data, 0)
+    if magic != PBI_MAGIC:
+        raise Exception("%r is not a pacbio bam index" % file)
+
+    start = PBI_HEADER.size
+    fields = collections.OrderedDict()
+    for name, dtype in [("rgId", "<i4"), ("qStart", "<i4"), ("qEnd", "<i4"), ("holeNumber", "<i4"),
+            ("readQual", "<f4"), ("ctxtFlag", "u1"), ("fileOffset", "<i8")]:
+        fields[name] = np.frombuffer(data, dtype=dtype, count=nreads, offset=start)
+        start += fields[name].nbytes
+
+    return fields["rgId"], fields["holeNumber"], fields["fileOffset"]
+
+
+def read_group_movies(header):
+    '''Map the integer form of the pacbio read group ids to movie names'''
+
+    movies = {}
+
+    for rg in header.to_dict().get("RG", []):
+        if "PU" not in rg:
+            continue
+        rgid = int(rg["ID"].split("/")[0], 16)
+        if rgid >= 1 << 31:
+            rgid -= 1 << 32
+        movies[rgid] = rg["PU"]
+
+    return movies
+
+
+def first_of_zmw(movie, hole):
+    '''Return the positions where a new movie/zmw starts'''
+
+    if not len(hole):
+        return np.zeros(0, dtype=np.int64)
+
+    change = np.ones(len(hole), dtype=bool)
+    change[1:] = (movie[1:] != movie[:-1]) | (hole[1:] != hole[:-1])
+
+    return np.flatnonzero(change)
+
+
+def pbi_offsets(file, header):
+
+    rgid, hole, offset = read_pbi(file)
+    rgmovies = read_group_movies(header)
+    movies = sorted(set(rgmovies.values()))
+
+    ids = np.zeros(len(rgid), dtype=np.int32)
+    for key in np.unique(rgid):
+        if key not in rgmovies:
+            LOG.warning("%s: read group %08x has no movie name (PU), index not used" % (file, int(key) & 0xffffffff))
+            return None
+        ids[rgid == key] = movies.index(rgmovies[key])
+
+    first = first_of_zmw(ids, hole)
+
+    return ZmwOffsets(movies, ids[first], hole[first].astype(np.int64), offset[first])
+
+
+def sidecar_offsets(file, bam):
+
+    stat = os.stat(bam)
+
+    try:
+        with np.load(file, allow_pickle=False) as fp:
+            data = dict((key, fp[key]) for key in fp.files)
+        offsets = ZmwOffsets(list(data["movies"]), data["movie"], data["hole"], data["offset"])
+    except Exception as error:
+        LOG.warning("cannot read zmw index %s, index not used: %s" % (file, error))
+        return None
+
+    if int(data["size"]) != stat.st_size or int(data["mtime"]) != int(stat.st_mtime):
+        LOG.info("%s is older than %s, index not used" % (file, bam))
+        return None
+
+    return offsets
+
+
+def load_zmw_offsets(bam, header):
+    '''Load the zmw offsets from bam.pbi or the bam.zmi sidecar, None if neither can be used'''
+
+    if os.path.exists(bam + ".pbi"):
+        LOG.info("reading zmw offsets from %s.pbi" % bam)
+        offsets = pbi_offsets(bam + ".pbi", header)
+        if offsets is not None:
+            return offsets
+    if os.path.exists(bam + ZMW_INDEX_SUFFIX):
+        LOG.info("reading zmw offsets from %s%s" % (bam, ZMW_INDEX_SUFFIX))
+        return sidecar_offsets(bam + ZMW_INDEX_SUFFIX, bam)
+
+    return None
+
+
+def write_zmw_offsets(bam, offsets):
+    '''Cache the zmw offsets of a bam file as the bam.zmi sidecar'''
+
+    stat = os.stat(bam)
+    file = bam + ZMW_INDEX_SUFFIX
+    # a killed run or a concurrent one never leaves a partial index
+    temp = "%s.%d.tmp" % (file, os.getpid())
+
+    try:
+        with open(temp, "wb") as fp:
+            np.savez(fp, movies=np.array(offsets.movies, dtype=str), movie=offsets.movie,
+                hole=offsets.hole, offset=offsets.offset, size=stat.st_size, mtime=int(stat.st_mtime))
+        os.rename(temp, file)
+    except (IOError, OSError) as error:
+        LOG.warning("cannot write zmw index %s: %s" % (file, error))
+        if os.path.exists(temp):
+            os.remove(temp)
+        return None
+
+    LOG.info("wrote zmw offsets to %s" % file)
+    return file
+
+
+def index_records(fh, bam):
+    '''Yield every record of fh and cache the zmw offsets as bam.zmi at the end'''
+
+    movies = collections.OrderedDict()
+    movie = []
+    hole = []
+    offset = []
+    last = None
+
+    while True:
+        position = fh.tell()
+        try:
+            record = next(fh)
+        except StopIteration:
+            break
+        zmw = zmw_prefix(record.query_name)
+        if zmw != last:
+            last = zmw
+            name, number = parse_zmw(record.query_name)
+            movie.append(movies.setdefault(name, len(movies)))
+            hole.append(number)
+            offset.append(position)
+        yield record
+
+    write_zmw_offsets(bam, ZmwOffsets(list(movies), np.array(movie, dtype=np.int32),
+        np.array(hole, dtype=np.int64), np.array(offset, dtype=np.int64)))
+
+
+def select_offsets(offsets, index):
+    '''Return the sorted offsets of the zmws of offsets that are set in index
+
+    index is a {movie: zmw bitmap} or {movie: (zmw holes, sample numbers)},
+    as built by zmwindex.build_zmw_index or zmwindex.build_zmw_map.
+    '''
+
+    keep = np.zeros(len(offsets.hole), dtype=bool)
+
+    for i, movie in enumerate(offsets.movies):
+        if movie not in index:
+            continue
+        if isinstance(index[movie], bytes):
+            bits = np.frombuffer(index[movie], dtype=np.uint8)
+            mask = (offsets.movie == i) & (offsets.hole < len(bits) << 3)
+            hole = offsets.hole[mask]
+            keep[mask] = (bits[hole >> 3] >> (hole & 7)) & 1
+        else:
+            mask = offsets.movie == i
+            keep[mask] = np.isin(offsets.hole[mask], np.frombuffer(index[movie][0], dtype=np.int_))
+
+    return np.sort(offsets.offset[keep])
+
+
+def seek_records(fh, offsets):
+    '''Yield the records of the zmws that start at the given virtual offsets'''
+
+    for offset in offsets:
+        offset = int(offset)
+        if fh.tell() != offset:
+            fh.seek(offset)
+
+        record = next(fh, None)
+        if record is None:
+            continue
+        zmw = zmw_prefix(record.query_name)
+        while record is not None and zmw_prefix(record.query_name) == zmw:
+            yield record
+            record = next(fh, None)
+
+
+def range_records(fh, start=None, end=None):
+    '''Yield the records of fh from the virtual offset start up to end
+
+    start=None is the first record and end=None the end of the file, as
+    in the ranges of rawbam.split_bam.
+    '''
+
+    if start is not None:
+        fh.seek(start)
+
+    while end is None or fh.tell() < end:
+        record = next(fh, None)
+        if record is None:
+            break
+        yield record
@@ -4,10 +4,13 @@
 import os
 import re
 import sys
-import pysam
 import logging
 import argparse
 
+from seqio import open_bam, read_batches, open_output, encode_fastq
+from orient import read_orient_barcodes, orient_batch
+from runstats import phase, timed, count, add_stats_args, run_main
+
 LOG = logging.getLogger(__name__)
 
 __version__ = "1.0.0"
@@ -16,24 +19,10 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_bam(file):
-
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
-
-    for line in fh:
-        #yield [line.qname, line.seq, pysam.array_to_qualitystring(line.query_qualities), line.get_tag('rq')]
-        yield line.qname, line.seq, pysam.array_to_qualitystring(line.query_qualities)
-
-    fh.close()
-
+def bams2fqs(files, threads=1, compress=False, orient=None):
 
-def bams2fqs(files):
-    
+    if orient:
+        orient = read_orient_barcodes(orient)
     for file in files:
         name = file.split('/')[-1]
         if '--' in name:
@@ -41,16 +30,30 @@ def bams2fqs(files):
         else:
             name = name.split('.')[0]
 
-        fp = open("%s.fastq" % name, 'w')
-        for seqid, seq, quality  in read_bam(file):
-            fp.write('@%s\n%s\n+\n%s\n' % (seqid, seq, quality))
+        with phase("open"):
+            fh = open_bam(file, threads)
+            if compress:
+                fp = open_output("%s.fastq.gz" % name, "bgzip", threads=threads)
+            else:
+                fp = open_output("%s.fastq" % name)
+        count(files=[file])
+        for records in timed(read_batches(fh), size=len):
+            with phase("write"):
+                fp.write(encode_fastq(records, reverse=orient_batch(records, orient)))
         fp.close()
+        fh.close()
 
 
 def add_hlep_args(parser):
 
     parser.add_argument('bam', nargs='+', metavar='FILE', type=str,
         help='Input reads file, format(bam and sam).')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam decompression and fastq compression, default=1.')
+    parser.add_argument('-c', '--compress', action='store_true',
+        help='Write bgzip compressed sample.fastq.gz files.')
+    parser.add_argument('--orient', metavar='FASTA', type=str, default=None,
+        help='Forward (5\') barcodes, reads of the reverse strand are reverse complemented.')
 
     return parser
 
@@ -70,14 +73,15 @@ name:
      
 attention:
     bams2fqs.py *.bam
+    bams2fqs.py *.bam --compress --threads 8
 
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    bams2fqs(args.bam)
+    run_main(lambda: bams2fqs(args.bam, args.threads, args.compress, args.orient), args, "bams2fqs")
 
 
 if __name__ == "__main__":
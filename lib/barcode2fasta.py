@@ -4,9 +4,13 @@
 import os
 import re
 import sys
+import glob
 import logging
 import argparse
 
+from barcodedb import barcode_name, open_index, lookup_barcodes
+from runstats import add_stats_args, run_main
+
 
 LOG = logging.getLogger(__name__)
 
@@ -53,23 +57,32 @@ def read_barc_txt(file):
     return data
 
 
-def barcode2fasta(file, database):
-
-    data = read_barc_txt(file)
+def scan_database(database):
 
     for file in database:
         for line in read_tsv(file, '\t'):
-            name = line[1].strip().strip('F')
+            yield line[0], barcode_name(line[1]), line[2].strip()
 
-            if name in data:
-                print(">%s\n%s" % (data[name],  line[2].strip()))
-            elif line[0] in data:
-                print(">%s\n%s" % (data[line[0]],  line[2].strip()))
-            else:
-                continue
+
+def barcode2fasta(file, database, index=None):
+
+    data = read_barc_txt(file)
+
+    if index:
+        conn = open_index(index, database)
+        rows = [row[1:] for row in lookup_barcodes(conn, data)]
+        conn.close()
+    else:
+        rows = scan_database(database)
+
+    for bcid, name, seq in rows:
+        if name in data:
+            print(">%s\n%s" % (data[name], seq))
+        elif bcid in data:
+            print(">%s\n%s" % (data[bcid], seq))
 
     return 0
-              
+
 
 
 def add_hlep_args(parser):
@@ -79,6 +92,8 @@ def add_hlep_args(parser):
     parser.add_argument('-d','--database', nargs='+', metavar='FILE', type=str,
         default="/export/personal/software/Pipeline/sbarcode/v1.0.0/database/*.barcode.txt",
         help='Input barcode database.')
+    parser.add_argument('-x', '--index', metavar='FILE', type=str, default=None,
+        help='Barcode index (sqlite) built from the database on first use and rebuilt when a database file changes.')
 
     return parser
 
@@ -97,13 +112,16 @@ name:
 
 attention:
     barcode2fasta.py -i barcode.txt >barcode.fa
+    barcode2fasta.py -i barcode.txt -d *.barcode.txt --index barcode.db >barcode.fa
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
+    if isinstance(args.database, str):
+        args.database = sorted(glob.glob(args.database))
 
-    barcode2fasta(args.input, args.database)
+    run_main(lambda: barcode2fasta(args.input, args.database, args.index), args, "barcode2fasta")
 
 
 if __name__ == "__main__":
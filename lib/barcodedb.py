@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import os
+import sqlite3
+import logging
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["barcode_name", "open_index", "lookup_barcodes"]
+
+
+INDEX_VERSION = "1"
+# sqlite limits the number of host parameters of a statement
+QUERY_SIZE = 500
+
+
+def barcode_name(name):
+    '''Normalize the barcode name of a database row, BC-01F to BC-01'''
+
+    return name.strip().strip('F')
+
+
+def read_database(file):
+    '''Yield (barcode id, barcode name, sequence) of a *.barcode.txt database'''
+
+    for line in open(file):
+        line = line.strip()
+
+        if not line or line.startswith("#"):
+            continue
+
+        line = line.split('\t')
+        yield line[0], barcode_name(line[1]), line[2].strip()
+
+
+def file_stamps(database):
+
+    stamps = []
+
+    for file in database:
+        stat = os.stat(file)
+        stamps.append((os.path.abspath(file), stat.st_size, stat.st_mtime))
+
+    return stamps
+
+
+def build_index(database, index):
+    '''Compile the database files into the sqlite file index
+
+    Every row keeps its rank (file order, then line order), so a lookup
+    returns the rows in the order of a scan of the database files.
+    '''
+
+    temp = "%s.%d.tmp" % (index, os.getpid())
+    if os.path.exists(temp):
+        os.remove(temp)
+
+    conn = sqlite3.connect(temp)
+    conn.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE files (rank INTEGER PRIMARY KEY, path TEXT, size INTEGER, mtime REAL)")
+    conn.execute("CREATE TABLE barcode (rank INTEGER PRIMARY KEY, kit TEXT, id TEXT, name TEXT, seq TEXT)")
+    conn.execute("INSERT INTO info VALUES ('version', ?)", (INDEX_VERSION,))
+
+    rank = 0
+    for i, (path, size, mtime) in enumerate(file_stamps(database)):
+        LOG.info("indexing barcodes of %r" % path)
+        kit = os.path.basename(path).split(".barcode.txt")[0]
+        rows = []
+        for rank, (bcid, name, seq) in enumerate(read_database(path), rank):
+            rows.append((rank, kit, bcid, name, seq))
+        rank += 1
+        conn.executemany("INSERT INTO barcode VALUES (?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (i, path, size, mtime))
+
+    conn.execute("CREATE INDEX barcode_id ON barcode (id)")
+    conn.execute("CREATE INDEX barcode_name ON barcode (name)")
+    conn.commit()
+    conn.close()
+    os.rename(temp, index)
+    LOG.info("wrote barcode index %s" % index)
+
+    return index
+
+
+def is_current(conn, database):
+    '''Return True if the index was built from the database files as they are now'''
+
+    try:
+        version = conn.execute("SELECT value FROM info WHERE key='version'").fetchone()
+        stamps = conn.execute("SELECT path, size, mtime FROM files ORDER BY rank").fetchall()
+    except sqlite3.DatabaseError:
+        return False
+
+    if version is None or version[0] != INDEX_VERSION:
+        return False
+    if not database:
+        return True
+
+    return [tuple(i) for i in stamps] == file_stamps(database)
+
+
+def open_index(index, database=None):
+    '''Open the barcode index, (re)building it from the database files when needed
+
+    Without database files an existing index is used as it is.
+    '''
+
+    if os.path.exists(index):
+        conn = sqlite3.connect(index)
+        if is_current(conn, database):
+            LOG.info("reading barcodes from index %s" % index)
+            return conn
+        conn.close()
+        LOG.info("%s is out of date, rebuilt" % index)
+
+    if not database:
+        raise Exception("barcode index %r does not exist, give the database files to build it" % index)
+
+    build_index(database, index)
+
+    return sqlite3.connect(index)
+
+
+def lookup_barcodes(conn, keys):
+    '''Return (rank, id, name, seq) of the rows whose id or name is in keys, by rank'''
+
+    keys = list(keys)
+    rows = {}
+
+    for i in range(0, len(keys), QUERY_SIZE):
+        chunk = keys[i:i+QUERY_SIZE]
+        marks = ",".join("?"*len(chunk))
+        for row in conn.execute("SELECT rank, id, name, seq FROM barcode WHERE name IN (%s) OR id IN (%s)" % (marks, marks), chunk+chunk):
+            rows[row[0]] = row
+
+    return [rows[i] for i in sorted(rows)]
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import os
+import sys
+import gzip
+import array
+import json
+import time
+import shutil
+import pysam
+import logging
+import argparse
+import platform
+import subprocess
+
+import collections
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["make_dataset", "run_tool"]
+
+
+LIB = os.path.dirname(os.path.abspath(__file__))
+MOVIE = "m64001_200101_000000"
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+TOOLS = ["ccs2sub", "filter_ccs", "stat_barcode", "bam2fq", "bams2fqs", "rm_repeat_barcode"]
+
+
+def random_seq(rng, length):
+
+    return BASES[rng.integers(0, 4, length)].tobytes().decode()
+
+
+def random_qual(rng, length):
+
+    return rng.integers(1, 94, length).astype(np.uint8)
+
+
+def write_read(fh, header, name, seq, qual=None, tags=None):
+
+    line = pysam.AlignedSegment(header)
+    line.query_name = name
+    line.flag = 4
+    line.query_sequence = seq
+    if qual is not None:
+        line.query_qualities = array.array("B", qual.tobytes())
+    for tag, value in (tags or []):
+        line.set_tag(tag, value)
+    fh.write(line)
+
+
+def make_dataset(outdir, reads, samples=2, subreads=4, length=1000, seed=1):
+    '''Write a deterministic pacbio-like dataset of about reads ccs reads to outdir
+
+    subreads.bam      subreads named movie/zmw/start_end, one zmw in two has a ccs read
+    demux.bcNNNN--bcNNNN.bam
+                      ccs reads named movie/zmw/ccs with rq tags and qualities, one per sample
+    reads.fasta.gz, reads.fastq.gz
+                      the ccs reads of all samples
+    barcodes.fasta    16 bp barcodes, one per 100 reads (at least 96)
+    '''
+
+    rng = np.random.default_rng(seed)
+    header = pysam.AlignmentHeader.from_dict({
+        "HD": {"VN": "1.5", "SO": "unknown", "pb": "3.0.1"},
+        "RG": [{"ID": "0a1b2c3d", "PL": "PACBIO", "PU": MOVIE, "DS": "READTYPE=SUBREAD"}]
+    })
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    names = ["bc%04d--bc%04d" % (1001+i, 1001+i) for i in range(samples)]
+    sub = pysam.AlignmentFile(os.path.join(outdir, "subreads.bam"), "wb", header=header)
+    ccs = [pysam.AlignmentFile(os.path.join(outdir, "demux.%s.bam" % i), "wb", header=header) for i in names]
+    fasta = gzip.open(os.path.join(outdir, "reads.fasta.gz"), "wt", compresslevel=1)
+    fastq = gzip.open(os.path.join(outdir, "reads.fastq.gz"), "wt", compresslevel=1)
+
+    for hole in range(reads*2):
+        size = max(50, int(rng.normal(length, length*0.1)))
+        seq = random_seq(rng, size)
+        start = 0
+        for i in range(subreads):
+            end = start + size
+            write_read(sub, header, "%s/%d/%d_%d" % (MOVIE, hole, start, end), seq)
+            start = end + 40
+        if hole % 2:
+            continue
+        qual = random_qual(rng, size)
+        rq = float(1 - 10**(-rng.uniform(1, 5)))
+        name = "%s/%d/ccs" % (MOVIE, hole)
+        write_read(ccs[(hole//2) % samples], header, name, seq, qual, [("rq", rq)])
+        fasta.write(">%s\n%s\n" % (name, seq))
+        fastq.write("@%s\n%s\n+\n%s\n" % (name, seq, (qual+33).tobytes().decode()))
+
+    for fh in [sub, fasta, fastq] + ccs:
+        fh.close()
+
+    with open(os.path.join(outdir, "barcodes.fasta"), "w") as fh:
+        for i in range(max(96, reads//100)):
+            fh.write(">bc%d\n%s\n" % (i+1, random_seq(rng, 16)))
+
+    return names
+
+
+def tool_jobs(datadir, names, threads=1):
+    '''Return {tool: (script and arguments, input files)}'''
+
+    def path(name):
+        return os.path.join(datadir, name)
+
+    demux = [path("demux.%s.bam" % i) for i in names]
+
+    return {
+        "ccs2sub": (["ccs2sub.py", path("subreads.bam")] + sum([["--ccs", i] for i in demux], []) +
+            ["--outdir", "subreads", "-t", str(threads)],
+            [path("subreads.bam")] + demux),
+        "filter_ccs": (["filter_ccs.py", "-i"] + demux + ["-o", "filter_ccs.tsv", "-t", str(threads), "--no-cache"],
+            demux),
+        "stat_barcode": (["stat_barcode.py", "-i"] + demux + [path("reads.fasta.gz"), path("reads.fastq.gz"),
+            "-o", "stat.tsv", "-t", str(threads), "--no-cache"], demux + [path("reads.fasta.gz"), path("reads.fastq.gz")]),
+        "bam2fq": (["bam2fq.py", demux[0], "-o", "bam2fq.fastq", "-t", str(threads)],
+            demux[:1]),
+        "bams2fqs": (["bams2fqs.py"] + demux + ["-t", str(threads)],
+            demux),
+        "rm_repeat_barcode": (["rm_repeat_barcode.py", path("barcodes.fasta"), "--distance", "2"],
+            [path("barcodes.fasta")]),
+    }
+
+
+def count_records(file):
+
+    if file.endswith(".bam"):
+        with pysam.AlignmentFile(file, "rb", check_sq=False) as fh:
+            return sum(1 for i in fh)
+
+    fp = gzip.open(file, "rt") if file.endswith(".gz") else open(file)
+    lines = sum(1 for i in fp)
+    fp.close()
+
+    return lines // (4 if ".fastq" in file else 2)
+
+
+# runs a script as __main__ and records its own peak rss (VmHWM) at exit;
+# ru_maxrss of a child on linux also covers the parent it was forked from
+RSS_WRAPPER = """
+import sys, atexit, runpy
+def peak(file):
+    try:
+        for line in open("/proc/self/status"):
+            if line.startswith("VmHWM:"):
+                open(file, "w").write(line.split()[1])
+    except (IOError, OSError):
+        pass
+atexit.register(peak, sys.argv[1])
+sys.argv = sys.argv[2:]
+sys.path.insert(0, sys.argv[0].rsplit("/", 1)[0])
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def run_tool(args, workdir):
+    '''Run python lib/args[0] args[1:] in workdir, return (seconds, peak rss in MB, exit code)'''
+
+    log = open(os.path.join(workdir, "%s.log" % args[0]), "w")
+    peak = os.path.join(workdir, "%s.rss" % args[0])
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, "-c", RSS_WRAPPER, peak, os.path.join(LIB, args[0])] + args[1:],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=log)
+    pid, status, usage = os.wait4(proc.pid, 0)
+    seconds = time.time() - start
+    log.close()
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+
+    if os.path.exists(peak):
+        with open(peak) as fh:
+            rss = int(fh.read()) / 1024.0
+    else:
+        rss = usage.ru_maxrss / 1024.0
+        if sys.platform == "darwin":
+            rss /= 1024.0
+
+    return seconds, rss, proc.returncode
+
+
+def benchmark(scales, tools, workdir, threads=1, length=1000, keep=False):
+
+    results = []
+
+    for reads in scales:
+        datadir = os.path.join(workdir, "data_%d" % reads)
+        LOG.info("generating %d ccs reads in %s" % (reads, datadir))
+        names = make_dataset(datadir, reads, length=length)
+        jobs = tool_jobs(datadir, names, threads)
+        counts = {}
+
+        for tool in tools:
+            args, inputs = jobs[tool]
+            rundir = os.path.join(workdir, "run_%d_%s" % (reads, tool))
+            # outputs of a kept earlier run would change what the tool does
+            if os.path.isdir(rundir):
+                shutil.rmtree(rundir)
+            os.makedirs(rundir)
+            for file in inputs:
+                if file not in counts:
+                    counts[file] = count_records(file)
+            records = sum(counts[i] for i in inputs)
+            size = sum(os.path.getsize(i) for i in inputs)
+
+            seconds, rss, code = run_tool(args, rundir)
+            if code:
+                LOG.warning("%s failed with exit code %d, see %s" % (tool, code, rundir))
+            elif not keep:
+                shutil.rmtree(rundir)
+            LOG.info("%s %d reads: %.2fs" % (tool, reads, seconds))
+            results.append({
+                "tool": tool,
+                "scale": reads,
+                "records": records,
+                "bytes": size,
+                "seconds": round(seconds, 4),
+                "records_per_sec": round(records/seconds, 1),
+                "mb_per_sec": round(size/seconds/1e6, 3),
+                "peak_rss_mb": round(rss, 1),
+                "exit_code": code
+            })
+
+        if not keep:
+            shutil.rmtree(datadir)
+
+    return results
+
+
+def startup_times(repeat=5):
+    '''Return {command: best wall time in ms of sbarcode.py command -h}'''
+
+    from sbarcode import COMMANDS
+
+    times = collections.OrderedDict()
+
+    for name in [""] + list(COMMANDS):
+        args = [sys.executable, os.path.join(LIB, "sbarcode.py")] + ([name, "-h"] if name else ["-h"])
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            seconds = time.time() - start
+            if best is None or seconds < best:
+                best = seconds
+        times[name or "sbarcode"] = round(best*1000, 1)
+        LOG.info("startup of %s: %.1f ms" % (name or "sbarcode", best*1000))
+
+    return times
+
+
+def git_commit():
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=LIB,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(scales, tools, out=None, workdir=None, threads=1, length=1000, keep=False, startup=False):
+
+    # only the data and run directories of this run are removed from a given workdir
+    created = workdir is None or not os.path.isdir(workdir)
+    if workdir is None:
+        import tempfile
+        workdir = tempfile.mkdtemp(prefix="sbarcode_bench.")
+    elif created:
+        os.makedirs(workdir)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pysam": pysam.__version__,
+        "threads": threads,
+        "length": length,
+        "results": benchmark(scales, tools, workdir, threads, length, keep)
+    }
+    if startup:
+        report["startup_ms"] = startup_times()
+
+    if not keep and created and not os.listdir(workdir):
+        os.rmdir(workdir)
+
+    data = json.dumps(report, indent=2)
+    if out:
+        with open(out, "w") as fh:
+            fh.write(data + "\n")
+    else:
+        print(data)
+
+    return report
+
+
+def add_hlep_args(parser):
+
+    parser.add_argument('-s', '--scales', nargs='+', metavar='INT', type=int, default=[1000, 10000, 100000],
+        help='Numbers of ccs reads of the synthetic datasets, default=1000 10000 100000.')
+    parser.add_argument('--tools', nargs='+', choices=TOOLS, default=TOOLS,
+        help='Scripts to time, default=all.')
+    parser.add_argument('-l', '--length', metavar='INT', type=int, default=1000,
+        help='Mean read length of the synthetic reads, default=1000.')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads given to the scripts, default=1.')
+    parser.add_argument('-w', '--workdir', metavar='DIR', type=str, default=None,
+        help='Directory for the datasets and outputs, default is a temporary directory.')
+    parser.add_argument('-k', '--keep', action='store_true',
+        help='Keep the datasets and outputs.')
+    parser.add_argument('--startup', action='store_true',
+        help='Also time the startup (help output) of every sbarcode command.')
+    parser.add_argument('-o', '--out', metavar='FILE', type=str, default=None,
+        help='Output json file, default=stdout.')
+
+    return parser
+
+
+def main():
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="[%(levelname)s] %(message)s"
+    )
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+    description='''
+name:
+    benchmark.py Time the sbarcode scripts on synthetic pacbio data
+
+attention:
+    benchmark.py --out bench.json
+    benchmark.py --scales 1000 10000 --tools ccs2sub bam2fq --threads 4
+    benchmark.py --scales 1000 --tools rm_repeat_barcode --startup
+version: %s
+contact:  %s <%s>\
+        ''' % (__version__, ' '.join(__author__), __email__))
+
+    args = add_hlep_args(parser).parse_args()
+
+    run_benchmark(args.scales, args.tools, args.out, args.workdir, args.threads, args.length, args.keep,
+        args.startup)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -4,12 +4,18 @@
 import os
 import re
 import sys
-import gzip
-import pysam
 import logging
 import argparse
 
 import collections
+from functools import partial
+
+from seqio import read_reads, open_bam, open_output_bam
+from zmwindex import build_zmw_index, select_zmws, index_size, build_zmw_map, select_zmw_samples
+from rawbam import split_bam
+from parallel import map_jobs
+from bamindex import load_zmw_offsets, index_records, select_offsets, seek_records, range_records
+from runstats import phase, timed, writer, count, add_stats_args, run_main
 
 LOG = logging.getLogger(__name__)
 
@@ -19,6 +25,12 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
+SEEK_FRACTION = 0.3
+# the zmw map of the ccs2sub_parts workers, set once per worker by
+# set_part_map instead of being pickled with every part
+PART_ZMW_MAP = {}
+
+
 def get_sample(file):
 
     name = file.split('/')[-1]
@@ -31,154 +43,195 @@ def get_sample(file):
     return name
 
 
-def read_fasta(file):
-    '''Read fasta file'''
+def read_ccs(file, threads=1):
+    '''Index the zmws of the CCS reads, movie/zmw/ccs'''
+
+    reads = build_zmw_index(line.name for line in read_reads(file, quality=False, threads=threads))
+    LOG.info("%s: %d zmws" % (file, index_size(reads)))
+
+    return reads
+
+
+def read_subreads(fh, file, index, access="auto"):
+    '''Return the subread records to check against index
+
+    With a zmw offset index (file.pbi or the cached file.zmi) only the
+    zmws of index are read when they are a small part of the file, or
+    always with access="seek". Without one, the whole file is read and
+    file.zmi is written for the next run.
+    '''
+
+    if access == "scan" or not file.endswith(".bam"):
+        return fh
+
+    offsets = load_zmw_offsets(file, fh.header)
+    if offsets is None:
+        return index_records(fh, file)
+
+    wanted = select_offsets(offsets, index)
+    if access == "auto" and len(wanted) > SEEK_FRACTION*len(offsets.offset):
+        LOG.info("%d of %d zmws wanted, reading the whole file" % (len(wanted), len(offsets.offset)))
+        return fh
+
+    LOG.info("seeking %d of %d zmws" % (len(wanted), len(offsets.offset)))
+    return seek_records(fh, wanted)
+
+
+def part_name(output, number):
+
+    return "%s.part%d" % (output, number)
+
+
+def set_part_map(zmw_map):
+
+    global PART_ZMW_MAP
+    PART_ZMW_MAP = zmw_map
 
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fasta") or file.endswith(".fa"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = ''
-
-    for line in fp:
-        if type(line) == type(b''):
-            line = line.decode('utf-8')
-        line = line.strip()
-
-        if not line:
-            continue
-        if not seq:
-            seq += "%s\n" % line.strip(">").split()[0]
-            continue
-        if line.startswith(">"):
-            line = line.strip(">").split()[0]
-            seq = seq.split('\n')
-
-            yield [seq[0], seq[1]]
-            seq = ''
-            seq += "%s\n" % line
-        else:
-            seq += line
-
-    seq = seq.split('\n')
-    if len(seq)==2:
-        yield [seq[0], seq[1]]
-    fp.close()
-
-
-def read_fastq(file):
-    '''Read fastq file'''
-
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fastq") or file.endswith(".fq"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = []
-
-    for line in fp:
-        if type(line) == type(b''):
-            line = line.decode('utf-8')
-        line = line.strip()
-
-        if not line:
-            continue
-        if line.startswith('@') and (len(seq)==0 or len(seq)>=5):
-            seq.append(line.strip("@").split()[0])
-            continue
-        if line.startswith('@') and len(seq)==4:
-            yield seq
-            seq = []
-            seq.append(line.strip("@").split()[0])
-        else:
-            seq.append(line)
-
-    if len(seq)==4:
-        yield seq
-    fp.close()
-
-
-def read_bam(file):
-
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
 
-    for line in fh:
-        yield [line.qname, line.seq]
+def ccs2sub_part(part, file, outputs, level=None):
+    '''Write the subreads of part (number, (start, end)) of file to the parts of outputs, one per sample'''
+
+    number, (start, end) = part
+    fh = open_bam(file)
+    fos = [None]
+    for output in outputs:
+        fos.append(writer(open_output_bam(part_name(output, number), fh, 1, level)))
+
+    for sample, record in select_zmw_samples(PART_ZMW_MAP, timed(range_records(fh, start, end))):
+        fos[sample].write(record)
 
     fh.close()
+    for fo in fos[1:]:
+        fo.close()
 
+    return number
 
-def read_ccs(file):
 
-    reads = set()
+def concat_parts(output, parts):
+    '''Join the part bams into output with samtools cat, the parts are removed'''
 
-    if file.endswith(".fasta") or file.endswith(".fa") or file.endswith(".fa.gz") or file.endswith(".fasta.gz"):
-        fh = read_fasta(file)
-    elif file.endswith(".fastq") or file.endswith(".fq") or file.endswith(".fq.gz") or file.endswith(".fastq.gz"):
-        fh = read_fastq(file)
-    elif file.endswith(".bam") or file.endswith(".sam"):
-        fh = read_bam(file)
-    else:
-        raise Exception("%r file format error" % file)
+    import pysam
 
-    for line in fh:
-        seqid = line[0]
-        ccsid = line[0].split('/ccs')[0]
+    pysam.cat("--no-PG", "-o", output, *parts)
+    for part in parts:
+        os.remove(part)
 
-        reads.add(ccsid)
+    return output
 
-    return reads
 
+def ccs2sub_parts(file, zmw_map, outputs, level=None, access="auto", jobs=2):
+    '''Read the subreads bam in parts by jobs processes and join the parts of every output
 
-def ccs2sub(file, ccs, output):
+    The parts start at zmws of the .pbi or .zmi offsets when there are,
+    otherwise at the first record after an even byte position.
+    '''
 
-    reads = read_ccs(ccs)
-    name = get_sample(ccs)
+    with phase("open"):
+        offsets = None
+        if access != "scan":
+            fh = open_bam(file)
+            zmw_offsets = load_zmw_offsets(file, fh.header)
+            fh.close()
+            if zmw_offsets is not None:
+                offsets = zmw_offsets.offset
+        parts = split_bam(file, jobs, offsets)
+    LOG.info("reading %s in %d parts" % (file, len(parts)))
 
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
+    part = partial(ccs2sub_part, file=file, outputs=outputs, level=level)
+    for number in map_jobs(part, enumerate(parts), jobs, set_part_map, (zmw_map,)):
+        LOG.debug("part %d of %s done" % (number, file))
 
-    fname = os.path.abspath(output)
+    with phase("write"):
+        for output in outputs:
+            concat_parts(output, [part_name(output, i) for i in range(len(parts))])
 
-    if os.path.exists(fname):
-        os.remove(fname)
 
-    fo = pysam.AlignmentFile(fname, "wb", template=fh)
+def ccs2sub(file, ccs, output, threads=1, level=None, access="auto", jobs=1):
 
-    for line in fh:
-        seqid = line.qname.split('/')
-        ccsid = '/'.join(seqid[0:2])
+    if jobs > 1 and file.endswith(".bam") and access != "seek":
+        with phase("index"):
+            zmw_map = build_zmw_map([(line.name for line in read_reads(ccs, quality=False, threads=threads))])
+        count(files=[file, ccs])
+        return ccs2sub_parts(file, zmw_map, [os.path.abspath(output)], level, access, jobs)
 
-        if ccsid not in reads:
-            continue
+    with phase("index"):
+        reads = read_ccs(ccs, threads)
+    name = get_sample(ccs)
+    count(files=[file, ccs])
+
+    with phase("open"):
+        fh = open_bam(file, threads)
+        fname = os.path.abspath(output)
+        if os.path.exists(fname):
+            os.remove(fname)
+        fo = writer(open_output_bam(fname, fh, threads, level))
+
+    for line in select_zmws(reads, timed(read_subreads(fh, file, reads, access))):
         fo.write(line)
 
     fh.close()
     fo.close()
 
 
+def ccs2subs(file, ccs, outdir, threads=1, level=None, access="auto", jobs=1):
+    '''Split the subreads of several CCS files in one pass over the subreads file'''
+
+    names = [get_sample(i) for i in ccs]
+
+    for name in set(names):
+        if names.count(name) > 1:
+            raise Exception("Sample name %r is used by several CCS files" % name)
+
+    with phase("index"):
+        zmw_map = build_zmw_map((line.name for line in read_reads(i, quality=False, threads=threads)) for i in ccs)
+    count(files=[file] + ccs)
+
+    if jobs > 1 and file.endswith(".bam") and access != "seek":
+        outdir = os.path.abspath(outdir)
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        return ccs2sub_parts(file, zmw_map, [os.path.join(outdir, "%s.subreads.bam" % i) for i in names],
+            level, access, jobs)
+
+    with phase("open"):
+        fh = open_bam(file, threads)
+        outdir = os.path.abspath(outdir)
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+
+        # every writer has its own htslib thread pool, share the threads among them
+        wthreads = max(1, threads // len(ccs))
+        fos = [None]
+        for name in names:
+            fos.append(writer(open_output_bam(os.path.join(outdir, "%s.subreads.bam" % name), fh, wthreads, level)))
+
+    for number, line in select_zmw_samples(zmw_map, timed(read_subreads(fh, file, zmw_map, access))):
+        fos[number].write(line)
+
+    fh.close()
+    for fo in fos[1:]:
+        fo.close()
+
+
 def add_hlep_args(parser):
 
     parser.add_argument('subreads',
         help='Input subreads file, format(bam and sam).')
-    parser.add_argument('-c', '--ccs', metavar='FILE', type=str, required=True,
-        help='Input the CCS reads file, format(bam, sam, fastq, fasta).')
+    parser.add_argument('-c', '--ccs', action='append', metavar='FILE', type=str, required=True,
+        help='Input the CCS reads file, format(bam, sam, fastq, fasta), repeat it for several samples.')
     parser.add_argument('-o', '--out', metavar='FILE', type=str, default='out.subreads.bam',
-        help='Output file.')
+        help='Output file, used with a single CCS file.')
+    parser.add_argument('-d', '--outdir', metavar='DIR', type=str, default='./',
+        help='Output directory of the sample.subreads.bam files, used with several CCS files.')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam compression and decompression, default=1.')
+    parser.add_argument('-l', '--level', metavar='INT', type=int, choices=range(10), default=None,
+        help='Compression level of the output bam (0-9), default uses the htslib level.')
+    parser.add_argument('-a', '--access', choices=["auto", "scan", "seek"], default="auto",
+        help='Read the whole subreads file (scan) or seek to the wanted zmws with the .pbi or .zmi index (seek), default=auto.')
+    parser.add_argument('-j', '--jobs', metavar='INT', type=int, default=1,
+        help='Read the subreads bam in INT parts by INT processes (not with --access seek), '
+            'use at most the number of free cores, default=1.')
 
     return parser
 
@@ -197,13 +250,19 @@ name:
 
 attention:
     ccs2sub.py subreads.bam --ccs ccs.fa --out out.subreads.bam
+    ccs2sub.py subreads.bam --ccs a.ccs.bam --ccs b.ccs.bam --outdir subreads/
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    ccs2sub(args.subreads, args.ccs, args.out)
+    if len(args.ccs) == 1:
+        run_main(lambda: ccs2sub(args.subreads, args.ccs[0], args.out, args.threads, args.level, args.access,
+            args.jobs), args, "ccs2sub")
+    else:
+        run_main(lambda: ccs2subs(args.subreads, args.ccs, args.outdir, args.threads, args.level, args.access,
+            args.jobs), args, "ccs2sub")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import zlib
+import struct
+import logging
+
+import collections
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["bgzf_block", "BgzfWriter", "BGZF_EOF"]
+
+
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_HEADER = struct.Struct("<BBBBIBBHBBHH")
+BGZF_FOOTER = struct.Struct("<II")
+BGZF_EOF = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def bgzf_block(data, level=6):
+    '''Compress up to BGZF_BLOCK_SIZE bytes of data as one BGZF block'''
+
+    zobj = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = zobj.compress(data) + zobj.flush()
+    size = BGZF_HEADER.size + len(cdata) + BGZF_FOOTER.size
+
+    return b"".join([
+        BGZF_HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, size-1),
+        cdata,
+        BGZF_FOOTER.pack(zlib.crc32(data) & 0xffffffff, len(data))
+    ])
+
+
+class BgzfWriter(object):
+    '''Write BGZF (bgzip) compressed data to a binary file object
+
+    With threads > 1 the blocks are compressed by a thread pool (zlib
+    releases the GIL), in the style of pigz; the blocks are still
+    written in order, so the output is a normal BGZF/gzip file.
+    '''
+
+    def __init__(self, fp, level=6, threads=1):
+
+        self.fp = fp
+        self.level = level
+        self.buffer = bytearray()
+        self.pool = None
+        self.pending = collections.deque()
+        self.size = BGZF_BLOCK_SIZE
+
+        if threads > 1:
+            self.pool = ThreadPool(threads)
+            self.size = BGZF_BLOCK_SIZE * threads * 4
+
+    def write_blocks(self, data):
+
+        blocks = [bytes(data[i:i+BGZF_BLOCK_SIZE]) for i in range(0, len(data), BGZF_BLOCK_SIZE)]
+
+        if self.pool is None:
+            for block in blocks:
+                self.fp.write(bgzf_block(block, self.level))
+            return
+
+        self.pending.append(self.pool.map_async(partial(bgzf_block, level=self.level), blocks))
+        # keep one batch compressing while the caller produces the next one
+        while len(self.pending) > 1 or (self.pending and self.pending[0].ready()):
+            self.fp.write(b"".join(self.pending.popleft().get()))
+
+    def write(self, data):
+
+        self.buffer += data
+
+        if len(self.buffer) >= self.size:
+            end = len(self.buffer) - len(self.buffer) % BGZF_BLOCK_SIZE
+            self.write_blocks(self.buffer[:end])
+            del self.buffer[:end]
+
+        return len(data)
+
+    def close(self):
+
+        if self.buffer:
+            self.write_blocks(self.buffer)
+            self.buffer = bytearray()
+        while self.pending:
+            self.fp.write(b"".join(self.pending.popleft().get()))
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.fp.write(BGZF_EOF)
+        self.fp.close()
@@ -4,10 +4,15 @@
 import os
 import re
 import sys
-import pysam
 import logging
 import argparse
 
+import numpy as np
+
+from seqio import open_bam, read_batches, open_output, encode_fastq, BATCH_SIZE
+from orient import read_orient_barcodes, orient_batch
+from runstats import phase, timed, count, add_stats_args, run_main
+
 LOG = logging.getLogger(__name__)
 
 __version__ = "1.0.0"
@@ -16,29 +21,34 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_bam(file):
+def filter_batch(batch, qvalue, minlen, maxlen):
+    '''Return the records of a batch that pass the rq and length filter, and their rq'''
 
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
+    rq = [line.get_tag('rq') for line in batch]
+    length = np.fromiter((line.query_length for line in batch), dtype=np.int64, count=len(batch))
+    keep = np.flatnonzero((np.array(rq) >= qvalue) & (length >= minlen) & (length <= maxlen))
 
-    for line in fh:
-        yield [line.qname, line.seq, pysam.array_to_qualitystring(line.query_qualities), line.get_tag('rq')]
+    return [batch[i] for i in keep], [rq[i] for i in keep]
 
-    fh.close()
 
+def filter_bam2fq(file, qvalue=0.9, minlen=500, maxlen=10000, threads=1, batch=BATCH_SIZE,
+        out=None, compress=None, orient=None):
 
-def filter_bam2fq(file, qvalue=0.9, minlen=500, maxlen=10000):
+    with phase("open"):
+        fh = open_bam(file, threads)
+        fo = open_output(out, compress)
+    count(files=[file])
+    if orient:
+        orient = read_orient_barcodes(orient)
 
-    for line in read_bam(file):
-        if line[3] <qvalue:
-             continue
-        if len(line[1])<minlen or len(line[1])>maxlen:
-             continue
-        print('@%s rq=%s\n%s\n+\n%s' % (line[0], line[3], line[1], line[2]))
+    for records in timed(read_batches(fh, batch), size=len):
+        with phase("filter"):
+            records, rq = filter_batch(records, qvalue, minlen, maxlen)
+        with phase("write"):
+            fo.write(encode_fastq(records, ["rq=%s" % i for i in rq], orient_batch(records, orient)))
+
+    fo.close()
+    fh.close()
 
 
 def add_hlep_args(parser):
@@ -51,6 +61,14 @@ def add_hlep_args(parser):
         help='Input the minimum length of the filter, default=500.')
     parser.add_argument('--maxlen', metavar='INT', type=int, default=10000,
         help='Input the maximum length of the filter, default=10000.')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam decompression, default=1.')
+    parser.add_argument('-o', '--out', metavar='FILE', type=str, default=None,
+        help='Output file, default=stdout.')
+    parser.add_argument('-c', '--compress', choices=["gzip", "bgzip"], default=None,
+        help='Compress the output with gzip or bgzip, default is no compression.')
+    parser.add_argument('--orient', metavar='FASTA', type=str, default=None,
+        help='Forward (5\') barcodes, reads of the reverse strand are reverse complemented.')
 
     return parser
 
@@ -74,9 +92,10 @@ version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    filter_bam2fq(args.bam, args.qvalue, args.minlen, args.maxlen)
+    run_main(lambda: filter_bam2fq(args.bam, args.qvalue, args.minlen, args.maxlen, args.threads,
+        out=args.out, compress=args.compress, orient=args.orient), args, "filter_bam2fq")
 
 
 if __name__ == "__main__":
@@ -5,13 +5,19 @@ import os
 import re
 import sys
 import json
-import pysam
 import logging
 import argparse
 
 import collections
+from functools import partial
 import numpy as np
 
+from seqio import read_bam, read_lengths
+from parallel import map_jobs
+from histogram import BATCH_SIZE, length_histogram, reference_length, rq_bincount, rq_counts, rq_label
+from statcache import load_stat, save_stat
+from runstats import phase, timed, writer, count, add_stats_args, run_main
+
 LOG = logging.getLogger(__name__)
 
 __version__ = "1.2.0"
@@ -20,20 +26,7 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_bam(file):
-
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
-
-    for line in fh:
-        #line.get_tags('DB')
-        yield [line.qname, line.seq, pysam.array_to_qualitystring(line.query_qualities), line.get_tag('rq')]
-
-    fh.close()
+REPORT_RQ = [0.99, 0.999, 0.9999]
 
 
 def n50(lengths):
@@ -48,27 +41,26 @@ def n50(lengths):
             return i
 
 
-def stat_quality(file, model="model"):
+def stat_quality(file, model="model", threads=1, cache=True):
+    '''First pass, only the read length histogram is kept in memory
 
-    data = {}
-    total = 0
-    length = []
+    The histogram is cached in file.sbstat, a later run on the same file
+    takes the reference length from the cache without reading it.
+    '''
 
-    for line in read_bam(file):
-        total += 1
-        length.append(len(line[1]))
-        seqid = "%s [rq=%s]" % (line[0], line[3])
-        data[seqid] = [line[1], line[2], line[3]]
+    data = None
+    if cache:
+        data = load_stat(file, "filter_ccs", __version__)
+    if data is None:
+        data = {"length": length_histogram(read_lengths(file, threads))}
+        if cache:
+            save_stat(file, "filter_ccs", __version__, data)
 
-    if model=="model":
-        counts = np.bincount(length)
-        mean_len = np.argmax(counts)
-    elif model=="median":
-        mean_len = np.median(length)
-    else:
-        mean_len = np.mean(length)
+    counts = data["length"]
+    total = int(counts.sum())
+    mean_len = reference_length(counts, model)
 
-    return data, total, mean_len
+    return total, mean_len
 
 
 def get_sample(file):
@@ -83,43 +75,60 @@ def get_sample(file):
     return name
 
 
-def stat_reads(files, out, about, qvalue, model):
+def filter_file(file, about, qvalue, model, threads=1, cache=True, report=REPORT_RQ):
+    '''Write the reads of the length window with rq >= qvalue
+
+    The rq of all reads in the length window is counted in a phred binned
+    histogram, the number of reads for every rq of report is taken from it
+    instead of comparing each read to each threshold.
+    '''
+
 
-    title = ["Sample", "Total_CCS", "Q20_CCS", "Q30_CCS", "Q40_CCS", "Average_length(bp)", "Effective_Rate(%)"]
+    name = get_sample(file)
+    count(files=[file])
+    with phase("stat"):
+        total, mean_len = stat_quality(file, model, threads, cache)
+    fa = writer(open("%s.clean.fastq" % name, "w"))
+    rqs = np.zeros(1, dtype=np.int64)
+    window = []
+    passed = 0
+    bases = 0
+
+    for line in timed(read_bam(file, threads=threads)):
+        if mean_len+about<len(line.seq) or mean_len-about>len(line.seq):
+            continue
+        window.append(line.rq)
+        if len(window) >= BATCH_SIZE:
+            rqs = rqs + rq_bincount(window)
+            window = []
+        if line.rq<qvalue:
+            continue
+        bases += len(line.seq)
+        fa.write("@%s [rq=%s]\n%s\n+\n%s\n" % (line.name, line.rq, line.seq, line.qual))
+        passed += 1
+
+    fa.close()
+    rqs = rqs + rq_bincount(window)
+
+    return [name, total] + rq_counts(rqs, report, qvalue, passed) + [bases*1.0/passed, passed*100.0/total]
+
+
+def stat_reads(files, out, about, qvalue, model, threads=1, jobs=1, cache=True, report=REPORT_RQ):
+
+    title = ["Sample", "Total_CCS"] + ["%s_CCS" % rq_label(i) for i in report] + ["Average_length(bp)", "Effective_Rate(%)"]
     sdata = collections.OrderedDict()
     sample = collections.OrderedDict()
     fo = open(out, 'w')
-    fo.write('Sample\tTotal_CCS\tQ20_CCS\tQ30_CCS\tQ40_CCS\tAverage_length(bp)\tEffective_Rate(%)\n')
-    for file in files:
-        name = get_sample(file)
+    fo.write('%s\n' % '\t'.join(title))
+    form = '\t'.join(['{0}'] + ['{%d:,}' % (i+1) for i in range(len(report)+1)] + ['{%d:,.2f}' % (len(report)+2), '{%d:.2f}' % (len(report)+3)])
+    for line in map_jobs(partial(filter_file, about=about, qvalue=qvalue, model=model, threads=threads, cache=cache, report=report), files, jobs):
+        name = line[0]
         sdata[name] = collections.OrderedDict()
         sample[name] = [name, "", ""]
-        data, total, mean_len = stat_quality(file, model)
-        fa = open("%s.clean.fastq" % name, "w")
-        q20 = 0
-        q30 = 0
-        q40 = 0
-        length = []
-
-        for seqid in data:
-            line = data[seqid]
-            if mean_len+about<len(line[0]) or mean_len-about>len(line[0]):
-                continue
-            if line[2]<qvalue:
-                continue
-            length.append(len(line[0]))
-            fa.write("@%s\n%s\n+\n%s\n" % (seqid, line[0], line[1]))
-
-            q20 += 1
-            if line[2]>=0.999:
-                q30 += 1
-            if line[2]>=0.9999:
-                q40 += 1
-
-        fa.close()
-
-        fo.write('{0}\t{1:,}\t{2:,}\t{3:,}\t{4:,}\t{5:,.2f}\t{6:.2f}\n'.format(name, total, q20, q30, q40, sum(length)*1.0/len(length), q20*100.0/total))
-        line = [name, total, q20, q30, q40, round(sum(length)*1.0/len(length), 2), round(q20*100.0/total, 2)]
+
+        fo.write(form.format(*line) + '\n')
+        line[-2] = round(line[-2], 2)
+        line[-1] = round(line[-1], 2)
         for i in range(len(title)-1):
             sdata[name][title[i+1]] = line[i+1]
     fo.close()
@@ -136,10 +145,18 @@ def add_hlep_args(parser):
         help='Allowable read length error range, default=3bp.')
     parser.add_argument('-q', '--qvalue', metavar='FLOAT', type=float, default=0.99,
         help='input filtered quality value, default=0.99.')
+    parser.add_argument('-r', '--report', nargs='+', metavar='FLOAT', type=float, default=REPORT_RQ,
+        help='Report the number of reads with at least these rq, default=0.99 0.999 0.9999 (Q20 Q30 Q40).')
     parser.add_argument('-m', '--model',  choices=["model", "median", "mean"], default="model",
         help='Select the reference length for filtering, default=model.')
     parser.add_argument('-o', '--out', metavar='STR', type=str, default="out.tsv",
         help='Out name.')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam decompression, default=1.')
+    parser.add_argument('-j', '--jobs', metavar='INT', type=int, default=1,
+        help='Number of samples processed in parallel, default=1.')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+        help='Do not read or write the file.sbstat statistics cache.')
 
     return parser
 
@@ -162,9 +179,10 @@ version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    stat_reads(args.input, args.out, args.about, args.qvalue, args.model)
+    run_main(lambda: stat_reads(args.input, args.out, args.about, args.qvalue, args.model, args.threads, args.jobs,
+        args.cache, args.report), args, "filter_ccs")
 
 
 if __name__ == "__main__":
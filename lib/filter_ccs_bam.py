@@ -4,10 +4,15 @@
 import os
 import re
 import sys
-import pysam
 import logging
 import argparse
 
+from functools import partial
+
+from seqio import open_bam, open_output_bam, read_batches
+from pipeline import threaded_reader, ThreadedWriter, PIPE_BATCH_SIZE
+from parallel import map_jobs
+from runstats import phase, timed, writer, count, add_stats_args, run_main
 
 LOG = logging.getLogger(__name__)
 
@@ -29,31 +34,56 @@ def get_sample(file):
     return name
 
 
-def filter_bam(file, qvalue=0.9):
+def write_records(fo, records):
 
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
+    for line in records:
+        fo.write(line)
 
-    name = get_sample(file)
-    fo = pysam.AlignmentFile("%s.clean.bam" % name, "wb", template=fh)
 
-    for line in fh:
-        if line.get_tag('rq')<qvalue:
-            continue
-        fo.write(line)
+def filter_pipeline(fh, fo, qvalue):
+    '''Filter with a reader thread, this thread and a writer thread passing batches through bounded queues
+
+    pysam releases the GIL while htslib reads and writes records, so the
+    decompression, the rq check and the compression overlap.
+    '''
+
+    out = ThreadedWriter(partial(write_records, fo))
+
+    try:
+        for records in threaded_reader(timed(read_batches(fh, PIPE_BATCH_SIZE), size=len)):
+            with phase("filter"):
+                records = [line for line in records if line.get_tag('rq')>=qvalue]
+            out.put(records)
+    finally:
+        out.close()
+
+
+def filter_bam(file, qvalue=0.9, threads=1, level=None, pipeline=False):
+
+    with phase("open"):
+        fh = open_bam(file, threads)
+        name = get_sample(file)
+        fo = writer(open_output_bam("%s.clean.bam" % name, fh, threads, level))
+    count(files=[file])
+
+    if pipeline:
+        filter_pipeline(fh, fo, qvalue)
+    else:
+        for line in timed(fh):
+            if line.get_tag('rq')<qvalue:
+                continue
+            fo.write(line)
 
     fh.close()
     fo.close()
 
+    return file
+
 
-def filter_bams(files, qvalue):
+def filter_bams(files, qvalue, threads=1, level=None, jobs=1, pipeline=False):
 
-    for file in files:
-        filter_bam(file, qvalue)
+    for file in map_jobs(partial(filter_bam, qvalue=qvalue, threads=threads, level=level, pipeline=pipeline), files, jobs):
+        LOG.info("%s filtering completed" % file)
 
 
 def add_hlep_args(parser):
@@ -62,6 +92,14 @@ def add_hlep_args(parser):
         help='Input reads file, format(bam and sam).')
     parser.add_argument('-q', '--qvalue', metavar='FLOAT', type=float, default=0.9,
         help='input filtered quality value, default=0.9.')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam compression and decompression, default=1.')
+    parser.add_argument('-l', '--level', metavar='INT', type=int, choices=range(10), default=None,
+        help='Compression level of the output bam (0-9), default uses the htslib level.')
+    parser.add_argument('-j', '--jobs', metavar='INT', type=int, default=1,
+        help='Number of samples processed in parallel, default=1.')
+    parser.add_argument('-p', '--pipeline', action='store_true',
+        help='Read, filter and write in separate threads that pass batches of records through bounded queues.')
 
     return parser
 
@@ -84,9 +122,10 @@ version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    filter_bams(args.input, args.qvalue)
+    run_main(lambda: filter_bams(args.input, args.qvalue, args.threads, args.level, args.jobs,
+        args.pipeline), args, "filter_ccs_bam")
 
 
 if __name__ == "__main__":
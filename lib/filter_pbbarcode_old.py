@@ -5,14 +5,19 @@ import os
 import re
 import sys
 import json
-import gzip
-import pysam
 import logging
 import argparse
 
 import collections
+from functools import partial
 import numpy as np
 
+from seqio import read_reads, read_lengths
+from parallel import map_jobs
+from histogram import BATCH_SIZE, length_histogram, reference_length, rq_bincount, rq_counts, rq_label
+from statcache import load_stat, save_stat
+from runstats import phase, timed, writer, count, add_stats_args, run_main
+
 LOG = logging.getLogger(__name__)
 
 __version__ = "1.2.0"
@@ -21,87 +26,7 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_fasta(file):
-    '''Read fasta file'''
-
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fasta") or file.endswith(".fa"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = ''
-
-    for line in fp:
-        line = line.strip()
-
-        if not line:
-            continue
-        if not seq:
-            seq += "%s\n" % line.strip(">").split()[0]
-            continue
-        if line.startswith(">"):
-            line = line.strip(">").split()[0]
-            seq = seq.split('\n')
-
-            yield [seq[0], seq[1]]
-            seq = ''
-            seq += "%s\n" % line
-        else:
-            seq += line
-
-    seq = seq.split('\n')
-    if len(seq)==2:
-        yield [seq[0], seq[1]]
-    fp.close()
-
-
-def read_fastq(file):
-    '''Read fastq file'''
-
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fastq") or file.endswith(".fq"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = []
-
-    for line in fp:
-        line = line.strip()
-
-        if not line:
-            continue
-        if line.startswith('@') and (len(seq)==0 or len(seq)>=5):
-            seq.append(line.strip("@").split()[0])
-            continue
-        if line.startswith('@') and len(seq)==4:
-            yield seq
-            seq = []
-            seq.append(line.strip("@").split()[0])
-        else:
-            seq.append(line)
-
-    if len(seq)==4:
-        yield seq
-    fp.close()
-
-
-def read_bam(file):
-
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
-
-    for line in fh:
-        yield [line.qname, line.seq, line.get_tag('rq')]
-
-    fh.close()
+REPORT_RQ = [0.99, 0.999, 0.9999]
 
 
 def n50(lengths):
@@ -116,45 +41,35 @@ def n50(lengths):
             return i
 
 
-def read_file(file):
+def read_file(file, threads=1):
 
-    if file.endswith(".fasta") or file.endswith(".fa") or file.endswith(".fa.gz") or file.endswith(".fasta.gz"):
-        fh = read_fasta(file)
-    elif file.endswith(".fastq") or file.endswith(".fq") or file.endswith(".fq.gz") or file.endswith(".fastq.gz"):
-        fh = read_fastq(file)
-    elif file.endswith(".bam") or file.endswith(".sam"):
-        fh = read_bam(file)
-    else:
-        raise Exception("%r file format error" % file)
+    for line in read_reads(file, quality=False, threads=threads):
+        rq = line.rq
+        if rq is None:
+            rq = 1
+        yield [line.name, line.seq, rq]
 
-    for line in fh:
-        rq = 1
-        if len(line)<3:
-            line.append(rq)
-        yield line
 
+def stat_quality(file, model="model", threads=1, cache=True):
+    '''First pass, only the read length histogram is kept in memory
 
-def stat_quality(file, model="model"):
+    The histogram is cached in file.sbstat, a later run on the same file
+    takes the reference length from the cache without reading it.
+    '''
 
-    data = {}
-    total = 0
-    length = []
+    data = None
+    if cache:
+        data = load_stat(file, "filter_pbbarcode", __version__)
+    if data is None:
+        data = {"length": length_histogram(read_lengths(file, threads))}
+        if cache:
+            save_stat(file, "filter_pbbarcode", __version__, data)
 
-    for line in read_file(file):
-        total += 1
-        length.append(len(line[1]))
-        seqid = "%s [rq=%s]" % (line[0], line[2])
-        data[seqid] = [line[1], line[2]]
+    counts = data["length"]
+    total = int(counts.sum())
+    mean_len = reference_length(counts, model)
 
-    if model=="model":
-        counts = np.bincount(length)
-        mean_len = np.argmax(counts)
-    elif model=="median":
-        mean_len = np.median(length)
-    else:
-        mean_len = np.mean(length)
-
-    return data, total, mean_len
+    return total, mean_len
 
 
 def get_sample(file):
@@ -169,43 +84,60 @@ def get_sample(file):
     return name
 
 
-def stat_reads(files, out, about, qvalue, model):
+def filter_file(file, about, qvalue, model, threads=1, cache=True, report=REPORT_RQ):
+    '''Write the reads of the length window with rq >= qvalue
+
+    The rq of all reads in the length window is counted in a phred binned
+    histogram, the number of reads for every rq of report is taken from it
+    instead of comparing each read to each threshold.
+    '''
 
-    title = ["Sample", "Total_CCS", "Q20_CCS", "Q30_CCS", "Q40_CCS", "Average_length(bp)", "Effective_Rate(%)"]
+
+    name = get_sample(file)
+    count(files=[file])
+    with phase("stat"):
+        total, mean_len = stat_quality(file, model, threads, cache)
+    fa = writer(open("%s.clean.fasta" % name, "w"))
+    rqs = np.zeros(1, dtype=np.int64)
+    window = []
+    passed = 0
+    bases = 0
+
+    for seqid, seq, rq in timed(read_file(file, threads)):
+        if mean_len+about<len(seq) or mean_len-about>len(seq):
+            continue
+        window.append(rq)
+        if len(window) >= BATCH_SIZE:
+            rqs = rqs + rq_bincount(window)
+            window = []
+        if rq<qvalue:
+            continue
+        bases += len(seq)
+        fa.write(">%s [rq=%s]\n%s\n" % (seqid, rq, seq))
+        passed += 1
+
+    fa.close()
+    rqs = rqs + rq_bincount(window)
+
+    return [name, total] + rq_counts(rqs, report, qvalue, passed) + [bases*1.0/passed, passed*100.0/total]
+
+
+def stat_reads(files, out, about, qvalue, model, threads=1, jobs=1, cache=True, report=REPORT_RQ):
+
+    title = ["Sample", "Total_CCS"] + ["%s_CCS" % rq_label(i) for i in report] + ["Average_length(bp)", "Effective_Rate(%)"]
     sdata = collections.OrderedDict()
     sample = collections.OrderedDict()
     fo = open(out, 'w')
-    fo.write('Sample\tTotal_CCS\tQ20_CCS\tQ30_CCS\tQ40_CCS\tAverage_length(bp)\tEffective_Rate(%)\n')
-    for file in files:
-        name = get_sample(file)
+    fo.write('%s\n' % '\t'.join(title))
+    form = '\t'.join(['{0}'] + ['{%d:,}' % (i+1) for i in range(len(report)+1)] + ['{%d:,.2f}' % (len(report)+2), '{%d:.2f}' % (len(report)+3)])
+    for line in map_jobs(partial(filter_file, about=about, qvalue=qvalue, model=model, threads=threads, cache=cache, report=report), files, jobs):
+        name = line[0]
         sdata[name] = collections.OrderedDict()
         sample[name] = [name, "", ""]
-        data, total, mean_len = stat_quality(file, model)
-        fa = open("%s.clean.fasta" % name, "w")
-        q20 = 0
-        q30 = 0
-        q40 = 0
-        length = []
-
-        for seqid in data:
-            line = data[seqid]
-            if mean_len+about<len(line[0]) or mean_len-about>len(line[0]):
-                continue
-            if line[1]<qvalue:
-                continue
-            length.append(len(line[0]))
-            fa.write(">%s\n%s\n" % (seqid, line[0]))
-
-            q20 += 1
-            if line[1]>=0.999:
-                q30 += 1
-            if line[1]>=0.9999:
-                q40 += 1
-
-        fa.close()
-
-        fo.write('{0}\t{1:,}\t{2:,}\t{3:,}\t{4:,}\t{5:,.2f}\t{6:.2f}\n'.format(name, total, q20, q30, q40, sum(length)*1.0/len(length), q20*100.0/total))
-        line = [name, total, q20, q30, q40, round(sum(length)*1.0/len(length), 2), round(q20*100.0/total, 2)]
+
+        fo.write(form.format(*line) + '\n')
+        line[-2] = round(line[-2], 2)
+        line[-1] = round(line[-1], 2)
         for i in range(len(title)-1):
             sdata[name][title[i+1]] = line[i+1]
     fo.close()
@@ -222,10 +154,18 @@ def add_hlep_args(parser):
         help='Allowable read length error range, default=3bp.')
     parser.add_argument('-q', '--qvalue', metavar='FLOAT', type=float, default=0.99,
         help='input filtered quality value, default=0.99.')
+    parser.add_argument('-r', '--report', nargs='+', metavar='FLOAT', type=float, default=REPORT_RQ,
+        help='Report the number of reads with at least these rq, default=0.99 0.999 0.9999 (Q20 Q30 Q40).')
     parser.add_argument('-m', '--model',  choices=["model", "median", "mean"], default="model",
         help='Select the reference length for filtering, default=model.')
     parser.add_argument('-o', '--out', metavar='STR', type=str, default="out.tsv",
         help='Out name.')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam decompression, default=1.')
+    parser.add_argument('-j', '--jobs', metavar='INT', type=int, default=1,
+        help='Number of samples processed in parallel, default=1.')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+        help='Do not read or write the file.sbstat statistics cache.')
 
     return parser
 
@@ -250,9 +190,10 @@ version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    stat_reads(args.input, args.out, args.about, args.qvalue, args.model)
+    run_main(lambda: stat_reads(args.input, args.out, args.about, args.qvalue, args.model, args.threads, args.jobs,
+        args.cache, args.report), args, "filter_pbbarcode")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import logging
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["length_histogram", "reference_length", "LengthStat", "length_stat",
+    "rq_histogram", "rq_count", "rq_counts", "rq_label"]
+
+
+BATCH_SIZE = 1 << 16
+LENGTH_CAP = 1 << 17
+OVERFLOW_WIDTH = 1000
+RQ_BINS = 100
+RQ_MAX_PHRED = 60
+
+
+def iter_batches(values, batch=BATCH_SIZE):
+    '''Group an iterable of values into lists of up to batch values'''
+
+    values = iter(values)
+
+    while True:
+        chunk = []
+        for i in values:
+            chunk.append(i)
+            if len(chunk) >= batch:
+                break
+        if not chunk:
+            return
+        yield chunk
+
+
+def add_counts(counts, values):
+    '''Add np.bincount(values) to counts, growing counts when needed'''
+
+    new = np.bincount(np.asarray(values, dtype=np.int64))
+
+    if len(new) > len(counts):
+        new[:len(counts)] += counts
+        return new
+
+    counts[:len(new)] += new
+    return counts
+
+
+def length_histogram(lengths, batch=BATCH_SIZE):
+    '''Count read lengths, counts[i] is the number of reads of length i'''
+
+    counts = np.zeros(1, dtype=np.int64)
+
+    for values in iter_batches(lengths, batch):
+        counts = add_counts(counts, values)
+
+    return counts
+
+
+def histogram_value(counts, rank):
+    '''Return the length at 0-based rank of the sorted lengths'''
+
+    return int(np.searchsorted(np.cumsum(counts), rank + 1))
+
+
+def histogram_median(counts):
+
+    total = int(counts.sum())
+
+    return (histogram_value(counts, (total-1)//2) + histogram_value(counts, total//2)) / 2.0
+
+
+def histogram_mean(counts):
+
+    return float(np.dot(np.arange(len(counts)), counts)) / counts.sum()
+
+
+def reference_length(counts, model="model"):
+    '''Select the reference length for filtering from a length histogram'''
+
+    if model=="model":
+        return np.argmax(counts)
+    elif model=="median":
+        return histogram_median(counts)
+
+    return histogram_mean(counts)
+
+
+class LengthStat(object):
+    '''Streaming read length statistics in constant memory
+
+    Lengths below cap are counted in exact bins and longer ones in
+    overflow bins of width bp. The number of reads, bases and the
+    longest read stay exact; an Nx that falls in an overflow bin is
+    reported as the lower edge of that bin.
+    '''
+
+    def __init__(self, cap=LENGTH_CAP, width=OVERFLOW_WIDTH):
+
+        self.cap = cap
+        self.width = width
+        self.counts = np.zeros(cap, dtype=np.int64)
+        self.overflow = {}
+        self.number = 0
+        self.bases = 0
+        self.longest = 0
+
+    def update(self, lengths):
+        '''Add a batch of read lengths'''
+
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if not len(lengths):
+            return self
+
+        self.number += len(lengths)
+        self.bases += int(lengths.sum())
+        self.longest = max(self.longest, int(lengths.max()))
+
+        small = lengths < self.cap
+        self.counts += np.bincount(lengths[small], minlength=self.cap)
+        for length in lengths[~small]:
+            bins = self.overflow.setdefault(int(length) // self.width, [0, 0])
+            bins[0] += 1
+            bins[1] += int(length)
+
+        return self
+
+    def to_arrays(self):
+        '''Return the statistics as a dict of numpy arrays, see from_arrays'''
+
+        keys = sorted(self.overflow)
+
+        return {
+            "counts": self.counts,
+            "overflow": np.array([[i]+self.overflow[i] for i in keys], dtype=np.int64).reshape(-1, 3),
+            "summary": np.array([self.cap, self.width, self.number, self.bases, self.longest], dtype=np.int64)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+
+        cap, width, number, bases, longest = [int(i) for i in arrays["summary"]]
+        stat = cls(cap, width)
+        stat.counts = np.array(arrays["counts"], dtype=np.int64)
+        stat.overflow = dict((int(i), [int(n), int(b)]) for i, n, b in arrays["overflow"])
+        stat.number = number
+        stat.bases = bases
+        stat.longest = longest
+
+        return stat
+
+    def mean(self):
+
+        if not self.number:
+            return 0.0
+
+        return self.bases*1.0/self.number
+
+    def nx(self, x=50):
+        '''Return the length L where the reads of at least L bp hold x% of the bases'''
+
+        target = self.bases*x/100.0
+        accu = 0
+
+        if not self.bases:
+            return 0
+
+        for i in sorted(self.overflow, reverse=True):
+            accu += self.overflow[i][1]
+            if accu >= target:
+                return max(i*self.width, self.cap)
+
+        accu += np.cumsum((self.counts*np.arange(self.cap))[::-1])
+        return int(self.cap - 1 - np.searchsorted(accu, target))
+
+
+def length_stat(lengths, batch=BATCH_SIZE):
+    '''Collect LengthStat from an iterable of read lengths'''
+
+    stat = LengthStat()
+
+    for values in iter_batches(lengths, batch):
+        stat.update(values)
+
+    return stat
+
+
+def rq_phred(rq):
+    '''Convert read quality (rq) values to phred scores, capped at RQ_MAX_PHRED'''
+
+    error = np.clip(1 - np.asarray(rq, dtype=np.float64), 10**(-RQ_MAX_PHRED/10.0), 1)
+
+    return -10*np.log10(error)
+
+
+def rq_histogram(rqs, batch=BATCH_SIZE):
+    '''Count rq values in phred bins of 1/RQ_BINS, the last bin holds rq >= Q60'''
+
+    counts = np.zeros(RQ_MAX_PHRED*RQ_BINS+1, dtype=np.int64)
+
+    for values in iter_batches(rqs, batch):
+        counts += rq_bincount(values)
+
+    return counts
+
+
+def rq_bincount(rqs):
+
+    bins = np.floor(rq_phred(rqs)*RQ_BINS + 1e-6).astype(np.int64)
+
+    return np.bincount(np.clip(bins, 0, RQ_MAX_PHRED*RQ_BINS), minlength=RQ_MAX_PHRED*RQ_BINS+1)
+
+
+def rq_count(counts, rq):
+    '''Return the number of reads of the rq histogram with at least rq
+
+    Exact for thresholds on the bin edges such as 0.99, 0.999 and 0.9999.
+    '''
+
+    start = int(np.floor(rq_phred(rq)*RQ_BINS + 1e-6))
+
+    return int(counts[min(start, len(counts)-1):].sum())
+
+
+def rq_counts(counts, thresholds, qvalue=0, passed=None):
+    '''Return the number of reads with at least each rq of thresholds
+
+    Only reads with rq >= qvalue count, passed is their exact number and
+    is used for the thresholds up to qvalue.
+    '''
+
+    if passed is None:
+        passed = rq_count(counts, qvalue)
+
+    return [passed if rq <= qvalue else rq_count(counts, rq) for rq in thresholds]
+
+
+def rq_label(rq):
+    '''Return the phred name of a rq threshold, Q20 for 0.99'''
+
+    return "Q%d" % int(round(float(rq_phred(rq))))
+
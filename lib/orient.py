@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import logging
+
+from seqio import read_fasta, reverse_complement
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["read_orient_barcodes", "orient_batch"]
+
+
+ORIENT_MARGIN = 20
+
+
+def read_orient_barcodes(file):
+    '''Read the forward (5') barcodes of a fasta file
+
+    Return the barcode lengths and a {sequence: is reverse} lookup of
+    the barcodes and their reverse complements.
+    '''
+
+    barcodes = {}
+
+    for record in read_fasta(file):
+        seq = record.seq.upper()
+        barcodes[seq] = False
+        barcodes.setdefault(reverse_complement(seq), True)
+
+    LOG.info("read %d forward barcodes from %s" % (len(barcodes)//2, file))
+    return sorted(set(len(i) for i in barcodes)), barcodes
+
+
+def find_barcode(seq, lengths, barcodes, reverse):
+
+    seq = seq.upper()
+
+    for length in lengths:
+        for start in range(len(seq)-length+1):
+            if barcodes.get(seq[start:start+length]) is reverse:
+                return True
+
+    return False
+
+
+def is_reverse(record, orient, margin=ORIENT_MARGIN):
+    '''Return True if the read is the reverse strand of its barcoded molecule
+
+    A forward read starts with a forward barcode, a reverse read ends
+    with the reverse complement of one. The barcodes clipped by lima
+    (bl and bt tags) are used when present, else the read ends.
+    '''
+
+    lengths, barcodes = orient
+    window = lengths[-1] + margin
+    seq = record.query_sequence or ""
+
+    head = record.get_tag("bl") if record.has_tag("bl") else seq[:window]
+    if find_barcode(head, lengths, barcodes, False):
+        return False
+
+    tail = record.get_tag("bt") if record.has_tag("bt") else seq[-window:]
+
+    return find_barcode(tail, lengths, barcodes, True)
+
+
+def orient_batch(records, orient, margin=ORIENT_MARGIN):
+    '''Return the list of reverse flags of a batch of bam records, None without orient'''
+
+    if not orient:
+        return None
+
+    return [is_reverse(record, orient, margin) for record in records]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import logging
+import multiprocessing
+
+from runstats import STATS
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["map_jobs"]
+
+
+def stats_job(job):
+    '''Run func(item) in a worker and return its result with the run statistics of the worker'''
+
+    func, item = job
+    STATS.enable()
+    STATS.reset()
+    result = func(item)
+
+    return result, STATS.snapshot()
+
+
+def map_jobs(func, items, jobs=1, initializer=None, initargs=()):
+    '''Apply func to every item with a process pool, results keep the input order
+
+    initializer(*initargs) is run once in every worker, or here when
+    there is no pool, to hand the workers data that is too large to
+    pickle with every item.
+    '''
+
+    items = list(items)
+
+    if jobs <= 1 or len(items) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+
+    pool = multiprocessing.Pool(min(jobs, len(items)), initializer, initargs)
+    try:
+        if STATS.enabled:
+            # the run statistics of the workers are merged into this process
+            for result, stats in pool.imap(stats_job, [(func, i) for i in items], chunksize=1):
+                STATS.merge(stats)
+                yield result
+        else:
+            for result in pool.imap(func, items, chunksize=1):
+                yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import logging
+import threading
+import queue
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["QUEUE_DEPTH", "PIPE_BATCH_SIZE", "threaded_reader", "ThreadedWriter"]
+
+
+QUEUE_DEPTH = 4
+PIPE_BATCH_SIZE = 1 << 12
+DONE = object()
+
+
+class Failure(object):
+    '''An exception raised in a pipeline thread, passed on through the queue'''
+
+    def __init__(self, error):
+
+        self.error = error
+
+
+def threaded_reader(iterable, depth=QUEUE_DEPTH):
+    '''Yield the items of iterable, produced ahead by a thread through a queue of depth items
+
+    An exception of the producer is raised in the consumer.
+    '''
+
+    items = queue.Queue(depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put(DONE)
+        except BaseException as error:
+            items.put(Failure(error))
+
+    thread = threading.Thread(target=produce, name="reader")
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is DONE:
+                break
+            if isinstance(item, Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full queue
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+
+class ThreadedWriter(object):
+    '''Call write(item) for every put item in a writer thread, with at most depth items waiting'''
+
+    def __init__(self, write, depth=QUEUE_DEPTH):
+
+        self.write = write
+        self.items = queue.Queue(depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.consume, name="writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def consume(self):
+
+        while True:
+            item = self.items.get()
+            if item is DONE:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.write(item)
+            except BaseException as error:
+                self.error = error
+
+    def put(self, item):
+
+        if self.error is not None:
+            self.close()
+        self.items.put(item)
+
+    def close(self):
+        '''Wait for the queued items to be written, an error of the writer is raised here'''
+
+        if self.thread.is_alive():
+            self.items.put(DONE)
+            self.thread.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import io
+import os
+import zlib
+import struct
+import logging
+
+from seqio import open_bam
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["find_record", "split_bam"]
+
+
+READ_SIZE = 1 << 22
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+MAX_RECORD_SIZE = 1 << 28
+NAME_CHARS = bytes(range(33, 127))
+INT32 = struct.Struct("<i")
+UINT16 = struct.Struct("<H")
+# a bam record up to read_name: block_size, refID, pos, l_read_name,
+# mapq, bin, n_cigar_op, flag, l_seq, next_refID, next_pos, tlen
+RECORD = struct.Struct("<iiiBBHHHiiii")
+
+
+def inflate_block(block):
+    '''Return the data of one BGZF block'''
+
+    return zlib.decompress(block[18:-8], -15)
+
+
+def split_blocks(data):
+    '''Split BGZF data into whole blocks, return (blocks, rest)'''
+
+    blocks = []
+    start = 0
+
+    while len(data) - start >= 18:
+        if data[start:start+4] != BGZF_MAGIC or data[start+12:start+14] != b"BC":
+            raise Exception("not a bgzf block at offset %d" % start)
+        end = start + UINT16.unpack_from(data, start+16)[0] + 1
+        if end > len(data):
+            break
+        blocks.append(data[start:end])
+        start = end
+
+    return blocks, data[start:]
+
+
+def find_block(fp, offset):
+    '''Return the offset of the first BGZF block at or after offset, None at the end of the file'''
+
+    size = os.fstat(fp.fileno()).st_size
+
+    while offset < size:
+        fp.seek(offset)
+        data = fp.read(1 << 17)
+        start = data.find(BGZF_MAGIC)
+        while 0 <= start <= len(data) - 18:
+            # a block header is only trusted when the next block follows it
+            end = start + UINT16.unpack_from(data, start+16)[0] + 1
+            if data[start+12:start+14] == b"BC" and (offset + end == size or
+                    data[end:end+4] == BGZF_MAGIC or end + 4 > len(data)):
+                return offset + start
+            start = data.find(BGZF_MAGIC, start+1)
+        offset += max(len(data) - 17, 1)
+
+    return None
+
+
+def is_record(data, start, n_ref):
+    '''Return True if records parse one after the other from start to the end of data
+
+    Only the last record may be cut by the end of data. A start inside
+    the sequence, qualities or tags of a record has to stay in step with
+    the real records over all of data to pass, not over a few records.
+    '''
+
+    number = 0
+
+    while start < len(data):
+        if len(data) - start < RECORD.size:
+            return number > 0
+        size, ref, pos, l_read_name, mapq, bin, n_cigar, flag, l_seq, next_ref, next_pos, tlen = \
+            RECORD.unpack_from(data, start)
+        if not (-1 <= ref < n_ref and -1 <= next_ref < n_ref and pos >= -1 and next_pos >= -1 and
+                l_read_name > 1 and l_seq >= 0 and size < MAX_RECORD_SIZE and
+                size >= 32 + l_read_name + 4*n_cigar + (l_seq+1)//2 + l_seq):
+            return False
+        name = data[start+36:start+35+l_read_name]
+        if len(name) < l_read_name - 1:
+            return number > 0
+        if data[start+35+l_read_name:start+36+l_read_name] != b"\x00" or name.translate(None, NAME_CHARS):
+            return False
+        start += 4 + size
+        number += 1
+
+    return number > 0
+
+
+def find_record(file, offset, n_ref):
+    '''Return the virtual offset of the first record starting at or after the block at offset'''
+
+    with io.open(file, "rb") as fp:
+        fp.seek(offset)
+        blocks, rest = split_blocks(fp.read(READ_SIZE))
+    chunk = [inflate_block(i) for i in blocks]
+    data = b"".join(chunk)
+
+    start = 0
+    for block, inflated in zip(blocks, chunk):
+        for i in range(len(inflated)):
+            if is_record(data, start + i, n_ref):
+                return (offset << 16) | i
+        offset += len(block)
+        start += len(inflated)
+
+    return None
+
+
+def split_bam(file, parts, offsets=None):
+    '''Split the records of a bam file into at most parts (start, end) virtual offset ranges
+
+    With offsets, the virtual offsets of the first record of every zmw in
+    file order from the .pbi or .zmi, a range starts at a zmw. Without, the file
+    is cut at even byte positions, moved on to the next BGZF block and
+    the next record that parses there. The first range starts at the
+    first record (start is None) and the last one ends at the end of the
+    file (end is None).
+    '''
+
+    starts = []
+
+    if offsets is not None:
+        for i in range(1, parts):
+            starts.append(int(offsets[len(offsets)*i//parts]))
+    else:
+        fh = open_bam(file)
+        n_ref = fh.nreferences
+        first = fh.tell()
+        fh.close()
+        size = os.path.getsize(file)
+        with io.open(file, "rb") as fp:
+            for i in range(1, parts):
+                offset = find_block(fp, size*i//parts)
+                if offset is None:
+                    break
+                start = find_record(file, offset, n_ref)
+                if start is not None:
+                    starts.append(start)
+
+        # a cut in the blocks of the header would split it
+        starts = [i for i in starts if i > first]
+
+    starts = sorted(set(starts))
+
+    return list(zip([None] + starts, starts + [None]))
@@ -7,6 +7,8 @@ import shutil
 import logging
 import argparse
 
+from runstats import add_stats_args, run_main
+
 
 LOG = logging.getLogger(__name__)
 
@@ -16,6 +18,11 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
+MODES = ["copy", "move", "hardlink", "symlink", "reflink"]
+# linux ioctl to share the extents of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
 def read_tsv(file, sep=None):
     """
     read tsv joined with sep
@@ -45,13 +52,93 @@ def move_file(file, nfile):
 
 def copy_file(file, nfile):
 
-    LOG.info("mv %s %s" % (file, nfile))
+    LOG.info("cp %s %s" % (file, nfile))
 
     shutil.copy(file, nfile)
 
     return 0
 
 
+def hardlink_file(file, nfile):
+
+    LOG.info("ln %s %s" % (file, nfile))
+
+    os.link(file, nfile)
+
+    return 0
+
+
+def symlink_file(file, nfile):
+
+    LOG.info("ln -s %s %s" % (file, nfile))
+
+    os.symlink(os.path.abspath(file), nfile)
+
+    return 0
+
+
+def reflink_file(file, nfile):
+
+    import fcntl
+
+    LOG.info("cp --reflink %s %s" % (file, nfile))
+
+    with open(file, "rb") as src, open(nfile, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copymode(file, nfile)
+
+    return 0
+
+
+def place_file(file, nfile, mode="copy"):
+    '''Put file at nfile with mode, return the mode used
+
+    hardlink and reflink fall back to copy when the filesystem cannot
+    do it, e.g. when file and nfile are on different devices.
+    '''
+
+    if os.path.lexists(nfile):
+        if os.path.exists(nfile) and os.path.samefile(file, nfile):
+            LOG.warning("%s and %s are the same file, skipped" % (file, nfile))
+            return "skip"
+        os.remove(nfile)
+
+    if mode == "copy":
+        copy_file(file, nfile)
+    elif mode == "move":
+        move_file(file, nfile)
+    elif mode == "symlink":
+        symlink_file(file, nfile)
+    elif mode in ("hardlink", "reflink"):
+        try:
+            if mode == "hardlink":
+                hardlink_file(file, nfile)
+            else:
+                reflink_file(file, nfile)
+        except (IOError, OSError, ImportError) as error:
+            if os.path.exists(nfile):
+                os.remove(nfile)
+            LOG.info("%s of %s is not possible (%s), copied" % (mode, file, getattr(error, "strerror", None) or error))
+            copy_file(file, nfile)
+            return "copy"
+    else:
+        raise Exception("%r is not a supported mode" % mode)
+
+    return mode
+
+
+def write_manifest(plan, out=None):
+    '''Write the (file, new file, mode) of the plan as tsv, stdout when out is None'''
+
+    fo = open(out, "w") if out else sys.stdout
+
+    for file, nfile, mode in plan:
+        fo.write("%s\t%s\t%s\n" % (file, nfile, mode))
+
+    if out:
+        fo.close()
+
+
 def mkdir(d):
     """
     from FALCON_KIT
@@ -80,13 +167,23 @@ def check_path(path):
     return path
 
 
+def barcode_key(rp, fp):
+    '''Return the canonical key of a barcode pair, the order of the pair does not matter'''
+
+    return tuple(sorted((rp, fp)))
+
+
 def find_file_name(file):
+    '''Return the barcode pair key of a lima output file (prefix.bc1--bc2.suffix), None when absent'''
 
     name = file.split('/')[-1]
-    rfp = name.split('.')[1]
-    rp, fp = rfp.split('--')
+    fields = name.split('.')
+
+    if len(fields) < 2 or fields[1].count('--') != 1:
+        return None
+    rp, fp = fields[1].split('--')
 
-    return {rp, fp}
+    return barcode_key(rp, fp)
 
 
 def read_barcode_name(file):
@@ -95,43 +192,112 @@ def read_barcode_name(file):
 
     for line in read_tsv(file, '\t'):
         if len(line) >= 3:
-            data[line[0]] = {line[1], line[2]}
+            data[line[0]] = barcode_key(line[1], line[2])
         else:
-            data[line[0]] = {line[1], line[1]}
+            data[line[0]] = barcode_key(line[1], line[1])
 
     return data
 
 
-def judge_primer(rfp, data):
-    
-    educt = 0
+def index_barcode_name(data):
+    '''Return {barcode pair key: sample} and {key: samples} of the keys given to several samples
 
-    for i in data:
-        if rfp==data[i]:
-           educt = i
-           break
+    The first sample of a key is used, as the linear search did.
+    '''
 
-    return educt
+    index = {}
+    ambiguous = {}
 
+    for sample in data:
+        key = data[sample]
+        if key in index:
+            ambiguous.setdefault(key, [index[key]]).append(sample)
+            continue
+        index[key] = sample
 
-def rename_lima_file(files, bname, path):
+    for key in ambiguous:
+        LOG.warning("barcodes %s are given to samples %s, %s is used" % ("--".join(key), ", ".join(ambiguous[key]), index[key]))
 
-    data = read_barcode_name(bname)
+    return index, ambiguous
+
+
+def judge_primer(rfp, index):
+
+    return index.get(rfp, 0)
+
+
+def write_report(report, out):
+    '''Write the status (renamed, unmatched, ambiguous or unnamed) of every input file as tsv'''
+
+    with open(out, "w") as fo:
+        fo.write("#file\tstatus\tsample\n")
+        for file, status, sample in report:
+            fo.write("%s\t%s\t%s\n" % (file, status, sample))
+
+
+def rename_lima_file(files, bname, path, mode="copy", threads=1, dry_run=False, manifest=None, report_file=None):
+
+    index, ambiguous = index_barcode_name(read_barcode_name(bname))
+    plan = []
+    report = []
+    found = set()
 
     for file in files:
         rfp = find_file_name(file)
-        name = judge_primer(rfp, data)
+        if rfp is None:
+            report.append((file, "unnamed", ""))
+            continue
+        name = judge_primer(rfp, index)
 
         if not name:
+            report.append((file, "unmatched", ""))
             continue
+        found.add(name)
+        report.append((file, "ambiguous" if rfp in ambiguous else "renamed", name))
 
         forms = file.split('/')[-1]
         forms = forms.split('.')[2::]
         forms = '.'.join(forms)
         path = check_path(path)
         nfile = os.path.join(path, "%s.%s" % (name, forms))
-        copy_file(file, nfile)
-        #move_file(file, nfile)
+        plan.append((file, nfile, mode))
+
+    unmatched = [i[0] for i in report if i[1] in ("unmatched", "unnamed")]
+    if unmatched:
+        LOG.warning("%d files match no sample: %s" % (len(unmatched), " ".join(unmatched)))
+    missing = sorted(set(index.values()) - found)
+    if missing:
+        LOG.warning("%d samples have no file: %s" % (len(missing), " ".join(missing)))
+    if report_file:
+        write_report(report, report_file)
+
+    # as with one copy after the other, the last file of a new name is kept
+    last = dict((nfile, i) for i, (file, nfile, mode) in enumerate(plan))
+    for i, (file, nfile, mode) in enumerate(plan):
+        if last[nfile] != i:
+            LOG.warning("%s and %s both go to %s, %s is kept" % (file, plan[last[nfile]][0], nfile, plan[last[nfile]][0]))
+    plan = [job for i, job in enumerate(plan) if last[job[1]] == i]
+
+    if dry_run:
+        write_manifest(plan, manifest)
+        return 0
+
+    def place(job):
+        return place_file(*job)
+
+    if threads > 1 and len(plan) > 1:
+        from multiprocessing.pool import ThreadPool  # slow to import, only needed here
+
+        # copies across devices are bound by io, a few run at the same time
+        pool = ThreadPool(min(threads, len(plan)))
+        modes = pool.map(place, plan, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        modes = [place(job) for job in plan]
+
+    if manifest:
+        write_manifest([(file, nfile, used) for (file, nfile, mode), used in zip(plan, modes)], manifest)
 
     return 0
 
@@ -144,6 +310,16 @@ def add_hlep_args(parser):
         help="Input sample and barcode number alignment file.")
     parser.add_argument("-p", "--path", metavar='FILE', type=str, default='./',
         help="The path where the input file needs to be moved.")
+    parser.add_argument("-m", "--mode", choices=MODES, default="copy",
+        help="How the files are put in the path, hardlink and reflink fall back to copy, default=copy.")
+    parser.add_argument("-t", "--threads", metavar='INT', type=int, default=1,
+        help="Number of files copied at the same time, default=1.")
+    parser.add_argument("-n", "--dry-run", action='store_true',
+        help="Only write the manifest (file, new file, mode), nothing is changed.")
+    parser.add_argument("--manifest", metavar='FILE', type=str, default=None,
+        help="Write the manifest to this file, default=stdout for --dry-run.")
+    parser.add_argument("-r", "--report", metavar='FILE', type=str, default=None,
+        help="Write the status of every input file (renamed, unmatched, ambiguous, unnamed) to this file.")
 
     return parser
 
@@ -166,13 +342,15 @@ sample  R  F
 
 attention:
     rename_lima_file.py --files * --bname barcode_name.txt
+    rename_lima_file.py --files * --bname barcode_name.txt --mode hardlink --path out/
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    rename_lima_file(args.files, args.bname, args.path)
+    run_main(lambda: rename_lima_file(args.files, args.bname, args.path, args.mode, args.threads,
+        args.dry_run, args.manifest, args.report), args, "rename_lima_file")
 
 
 if __name__ == "__main__":
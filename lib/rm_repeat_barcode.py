@@ -7,6 +7,10 @@ import sys
 import logging
 import argparse
 
+from seqio import read_fasta, reverse_complement
+from seqdist import near_pairs
+from runstats import add_stats_args, run_main
+
 
 LOG = logging.getLogger(__name__)
 
@@ -16,72 +20,52 @@ __email__ = "invicoun@foxmail.com"
 __all__ = []
 
 
-def read_fasta(file):
+def report_near_barcodes(barcodes, distance=1, metric="hamming", out=None):
+    '''Report the barcode pairs within distance, also against the reverse complement
 
-    '''Read fasta file'''
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fasta") or file.endswith(".fa"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
+    barcodes is a list of (seqid, seq), the pairs are written as
+    id1, id2, strand (+ or -) and distance to out when it is given.
+    '''
 
-    seq = []
-    for line in fp:
-        if isinstance(line, bytes):
-            line = line.decode('utf-8')
-        line = line.strip()
+    number = len(barcodes)
+    seqs = [seq.upper() for seqid, seq in barcodes]
+    seqs += [reverse_complement(seq) for seq in seqs]
+    pairs = set()
 
-        if not line:
+    for i, j, value in near_pairs(seqs, distance, metric):
+        if i >= number:
             continue
-        if line.startswith(">"):
-            line = line.strip(">")
-            if len(seq) == 2:
-                yield seq
-            seq = []
-            seq.append(line)
+        strand = "+"
+        if j >= number:
+            j -= number
+            strand = "-"
+        if i == j:
             continue
-        if len(seq) == 2:
-            seq[1] += line
-        else:
-            seq.append(line)
-
-    if len(seq) == 2:
-        yield seq
-    fp.close()
-
-
-def complement(seq):
-
-    cdict = {"A": "T",
-        "T": "A",
-        "G": "C",
-        "C": "G"
-    }
+        pairs.add((min(i, j), max(i, j), strand, value))
 
-    seq = list(seq.upper())
-    nseq = ""
-    for i in seq:
-        nseq += cdict[i]
+    fo = open(out, "w") if out else None
+    for i, j, strand, value in sorted(pairs):
+        LOG.warning("%s ~ %s: %s distance %d (%s)" % (barcodes[i][0], barcodes[j][0], metric, value, strand))
+        if fo:
+            fo.write("%s\t%s\t%s\t%d\n" % (barcodes[i][0], barcodes[j][0], strand, value))
+    if fo:
+        fo.close()
+    LOG.info("%d barcode pairs within %s distance %d" % (len(pairs), metric, distance))
 
-    return nseq
+    return sorted(pairs)
 
 
-def reverse_complement(seq):
-
-    seq = seq[::-1]
-
-    return complement(seq)
-
-
-def rm_repeat_barcode(file):
+def rm_repeat_barcode(file, distance=0, metric="hamming", pairs=None):
 
     seqs = {}
+    barcodes = []
 
-    for seqid, seq in read_fasta(file):
-        rcseq = reverse_complement(seq)
+    for record in read_fasta(file):
+        seqid, seq = record.name, record.seq
+        rcseq = reverse_complement(seq.upper())
         if seq not in seqs and rcseq not in seqs:
             print(">%s\n%s" % (seqid, seq))
+            barcodes.append((seqid, seq))
         else:
             if seq in seqs:
                 repeatid = seqs[seq]
@@ -91,6 +75,9 @@ def rm_repeat_barcode(file):
         seqs[rcseq] = seqid
         seqs[seq] = seqid
 
+    if distance > 0:
+        report_near_barcodes(barcodes, distance, metric, pairs)
+
     return 0
 
 
@@ -98,6 +85,12 @@ def add_hlep_args(parser):
 
     parser.add_argument('fasta', metavar='FILE', type=str,
         help='Input barcode sequence')
+    parser.add_argument('-d', '--distance', metavar='INT', type=int, default=0,
+        help='Also report the barcode pairs within this distance, default=0 (only exact repeats).')
+    parser.add_argument('-m', '--metric', choices=["hamming", "levenshtein"], default="hamming",
+        help='Distance used by --distance, default=hamming.')
+    parser.add_argument('-p', '--pairs', metavar='FILE', type=str, default=None,
+        help='Write the near barcode pairs (id1, id2, strand, distance) to this file.')
 
     return parser
 
@@ -115,13 +108,14 @@ name:
     rm_repeat_barcode.py: Remove repeat barcode sequences
 attention:
     rm_repeat_barcode.py barcode.fasta
+    rm_repeat_barcode.py barcode.fasta --distance 2 --metric levenshtein --pairs near.tsv
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    rm_repeat_barcode(args.fasta)
+    run_main(lambda: rm_repeat_barcode(args.fasta, args.distance, args.metric, args.pairs), args, "rm_repeat_barcode")
 
 
 if __name__ == "__main__":
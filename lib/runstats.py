@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import os
+import sys
+import json
+import time
+import logging
+
+import collections
+from contextlib import contextmanager
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["STATS", "phase", "timed", "writer", "count", "add_stats_args", "run_main"]
+
+
+class RunStats(object):
+    '''Wall time per phase and the records and bytes read by a run
+
+    Disabled by default, phase() and timed() then cost nothing; run_main
+    enables it for --stats and --profile.
+    '''
+
+    def __init__(self):
+
+        self.enabled = False
+        self.phases = collections.OrderedDict()
+        self.records = 0
+        self.bytes = 0
+
+    def enable(self):
+
+        self.enabled = True
+        self.start = time.time()
+
+        return self
+
+    @contextmanager
+    def phase(self, name):
+        '''Add the wall time of the with block to phase name'''
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.time() - start
+
+    def timed(self, iterable, name="parse", size=None):
+        '''Yield the items of iterable, the time spent in it is added to phase name
+
+        Every item counts as one record, or as size(item) records.
+        '''
+
+        if not self.enabled:
+            return iterable
+
+        return self.timed_items(iterable, name, size)
+
+    def timed_items(self, iterable, name, size):
+
+        iterable = iter(iterable)
+        clock = time.time
+        total = 0
+        records = 0
+
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterable)
+                except StopIteration:
+                    total += clock() - start
+                    return
+                total += clock() - start
+                records += size(item) if size else 1
+                yield item
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + total
+            self.records += records
+
+    def writer(self, fo, name="write"):
+        '''Return fo, with the time spent in fo.write added to phase name when enabled'''
+
+        if not self.enabled:
+            return fo
+
+        return TimedWriter(self, fo, name)
+
+    def count(self, records=0, files=None):
+        '''Add records and the size of the input files'''
+
+        if not self.enabled:
+            return
+
+        self.records += records
+        for file in files or []:
+            if os.path.isfile(file):
+                self.bytes += os.path.getsize(file)
+
+    def snapshot(self):
+
+        return {"phases": dict(self.phases), "records": self.records, "bytes": self.bytes}
+
+    def merge(self, data):
+        '''Add the snapshot of a worker process'''
+
+        for name in data["phases"]:
+            self.phases[name] = self.phases.get(name, 0) + data["phases"][name]
+        self.records += data["records"]
+        self.bytes += data["bytes"]
+
+    def reset(self):
+
+        self.phases = collections.OrderedDict()
+        self.records = 0
+        self.bytes = 0
+
+    def report(self, tool):
+
+        wall = time.time() - self.start
+
+        return collections.OrderedDict([
+            ("tool", tool),
+            ("argv", sys.argv),
+            ("wall_seconds", round(wall, 4)),
+            ("phases", collections.OrderedDict((i, round(self.phases[i], 4)) for i in self.phases)),
+            ("records", self.records),
+            ("bytes", self.bytes),
+            ("records_per_sec", round(self.records/wall, 1) if wall else 0),
+            ("mb_per_sec", round(self.bytes/wall/1e6, 3) if wall else 0),
+            ("peak_rss_mb", peak_rss())
+        ])
+
+
+class TimedWriter(object):
+
+    def __init__(self, stats, fo, name):
+
+        self.stats = stats
+        self.fo = fo
+        self.name = name
+        self.total = 0
+
+    def write(self, data):
+
+        start = time.time()
+        result = self.fo.write(data)
+        self.total += time.time() - start
+
+        return result
+
+    def close(self):
+
+        start = time.time()
+        self.fo.close()
+        self.total += time.time() - start
+        self.stats.phases[self.name] = self.stats.phases.get(self.name, 0) + self.total
+        self.total = 0
+
+    def __getattr__(self, name):
+
+        return getattr(self.fo, name)
+
+
+def peak_rss():
+    '''Return the peak rss in MB of this process and its finished worker processes'''
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == "darwin":
+        rss /= 1024.0
+
+    return round(rss / 1024.0, 1)
+
+
+STATS = RunStats()
+phase = STATS.phase
+timed = STATS.timed
+writer = STATS.writer
+count = STATS.count
+
+
+def add_stats_args(parser):
+
+    parser.add_argument('--stats', metavar='FILE', type=str, default=None,
+        help='Write the run time per phase, records, bytes and peak memory as json to this file.')
+    parser.add_argument('--profile', metavar='FILE', type=str, default=None,
+        help='Write a cProfile dump of the run to this file (view it with pstats or snakeviz).')
+
+    return parser
+
+
+def run_main(func, args, tool):
+    '''Call func(), with the --stats json and --profile dump of args when asked'''
+
+    if not args.stats and not args.profile:
+        return func()
+
+    STATS.enable()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        return func()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            LOG.info("wrote profile to %s" % args.profile)
+        if args.stats:
+            with open(args.stats, "w") as fh:
+                json.dump(STATS.report(tool), fh, indent=2)
+                fh.write("\n")
+            LOG.info("wrote run statistics to %s" % args.stats)
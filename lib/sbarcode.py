@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import os
+import sys
+import importlib
+
+import collections
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["COMMANDS", "main"]
+
+
+# the module of a subcommand is only imported when it is run, so the
+# light commands do not pay for pysam and numpy
+COMMANDS = collections.OrderedDict([
+    ("ccs2sub", ("ccs2sub", "Obtain subreads according to CCS reads")),
+    ("filter-ccs", ("filter_ccs", "Statistics filtering pacbio ccs reads")),
+    ("filter-ccs-bam", ("filter_ccs_bam", "Filter ccs bam files by read quality")),
+    ("filter-bam2fq", ("filter_bam2fq", "Filter a bam file by quality and length to fastq")),
+    ("filter-pbbarcode", ("filter_pbbarcode_old", "Statistics filtering pacbio ccs reads (fasta, fastq, bam)")),
+    ("stat", ("stat_barcode", "Statistics split reads")),
+    ("bam2fq", ("bam2fq", "Convert bam file to fastq file")),
+    ("bam2fa", ("bam2fa", "Convert bam file to fasta file")),
+    ("bams2fqs", ("bams2fqs", "Convert bam files to sample fastq files")),
+    ("rename", ("rename_lima_file", "Rename the file name after lima split")),
+    ("barcode2fasta", ("barcode2fasta", "Generate barcode sequence")),
+    ("rm-repeat", ("rm_repeat_barcode", "Remove repeat barcode sequences")),
+    ("benchmark", ("benchmark", "Time the scripts on synthetic pacbio data")),
+])
+
+
+def usage():
+
+    lines = ["usage: sbarcode <command> [options]", "", "commands:"]
+    for name in COMMANDS:
+        lines.append("    %-18s%s" % (name, COMMANDS[name][1]))
+    lines += ["", "Run 'sbarcode <command> -h' for the options of a command.",
+        "version: %s" % __version__,
+        "contact:  %s <%s>" % (' '.join(__author__), __email__)]
+
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv or argv[0] in ("-h", "--help"):
+        sys.stdout.write(usage())
+        return 0
+    if argv[0] in ("-v", "--version"):
+        sys.stdout.write("sbarcode %s\n" % __version__)
+        return 0
+    if argv[0] not in COMMANDS:
+        sys.stderr.write("sbarcode: unknown command %r\n\n%s" % (argv[0], usage()))
+        return 2
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    module = importlib.import_module(COMMANDS[argv[0]][0])
+    sys.argv = ["sbarcode %s" % argv[0]] + argv[1:]
+
+    return module.main()
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
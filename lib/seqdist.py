@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import logging
+
+import collections
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["hamming", "levenshtein", "near_pairs"]
+
+
+def hamming(a, b, limit=None):
+    '''Return the number of mismatches of two sequences of the same length, None when it is above limit'''
+
+    if len(a) != len(b):
+        return None
+
+    score = 0
+
+    for i, j in zip(a, b):
+        if i != j:
+            score += 1
+            if limit is not None and score > limit:
+                return None
+
+    return score
+
+
+def levenshtein(a, b, limit=None):
+    '''Return the edit distance of a and b, None when it is above limit
+
+    Uses the bit-parallel algorithm of Myers (1999) in the global form of
+    Hyyrö, one pass of a few integer operations per base of b.
+    '''
+
+    if limit is None:
+        limit = max(len(a), len(b))
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if not a:
+        return len(b)
+
+    peq = {}
+    for i, base in enumerate(a):
+        peq[base] = peq.get(base, 0) | (1 << i)
+
+    mask = (1 << len(a)) - 1
+    high = 1 << (len(a)-1)
+    pv = mask
+    mv = 0
+    score = len(a)
+
+    for base in b:
+        eq = peq.get(base, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+
+    if score > limit:
+        return None
+
+    return score
+
+
+def segments(length, parts):
+    '''Split range(length) into parts disjoint (start, end) segments'''
+
+    return [(length*i//parts, length*(i+1)//parts) for i in range(parts)]
+
+
+def hamming_candidates(seqs, distance):
+    '''Yield (i, j) pairs that share one of distance+1 segments at the same place
+
+    Two sequences within distance mismatches agree on at least one of
+    distance+1 disjoint segments (pigeonhole), so only the sequences in
+    the same segment bucket are compared.
+    '''
+
+    buckets = collections.defaultdict(list)
+
+    for i, seq in enumerate(seqs):
+        for start, end in segments(len(seq), distance+1):
+            buckets[(len(seq), start, seq[start:end])].append(i)
+
+    seen = set()
+    for key in buckets:
+        ids = buckets[key]
+        for x in range(len(ids)):
+            for y in range(x+1, len(ids)):
+                pair = (ids[x], ids[y])
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair
+
+
+def levenshtein_candidates(seqs, distance):
+    '''Yield (i, j) pairs where a k-mer of one seed of i lies near the same place in j
+
+    With k = shortest length // (distance+1), distance edits leave one of
+    the distance+1 disjoint k-mer seeds of a sequence intact, and it
+    appears in the other sequence shifted by at most distance bases.
+    '''
+
+    k = max(1, min(len(i) for i in seqs) // (distance+1))
+    kmers = collections.defaultdict(list)
+
+    for j, seq in enumerate(seqs):
+        for start in range(len(seq)-k+1):
+            kmers[seq[start:start+k]].append((j, start))
+
+    for i, seq in enumerate(seqs):
+        found = set()
+        for seed in range(distance+1):
+            start = seed*k
+            for j, position in kmers.get(seq[start:start+k], []):
+                if j > i and j not in found and abs(position-start) <= distance:
+                    found.add(j)
+        for j in sorted(found):
+            yield i, j
+
+
+def near_pairs(seqs, distance=1, metric="hamming"):
+    '''Yield (i, j, distance) of every pair of seqs within distance
+
+    seqs is a list of sequences, the pairs are found through an exact
+    seed index instead of comparing all pairs.
+    '''
+
+    if not seqs or distance < 1:
+        return
+
+    if metric == "hamming":
+        compare, candidates = hamming, hamming_candidates
+    else:
+        compare, candidates = levenshtein, levenshtein_candidates
+
+    for i, j in candidates(seqs, distance):
+        value = compare(seqs[i], seqs[j], distance)
+        if value is not None and value <= distance:
+            yield i, j, value
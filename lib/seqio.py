@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import io
+import sys
+import gzip
+import logging
+
+import collections
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["Record", "read_fasta", "read_fastq", "read_bam", "read_reads", "read_lengths",
+    "open_output", "encode_fastq", "encode_fasta", "reverse_complement"]
+
+
+CHUNK_SIZE = 1 << 22
+BATCH_SIZE = 1 << 16
+# a batch also ends at this many bases, so batches of hifi reads stay at a few tens of MB
+BATCH_BASES = 1 << 22
+FASTA_SUFFIX = (".fasta", ".fa", ".fasta.gz", ".fa.gz")
+FASTQ_SUFFIX = (".fastq", ".fq", ".fastq.gz", ".fq.gz")
+BAM_SUFFIX = (".bam", ".sam")
+
+# IUPAC codes, U is complemented to A
+BASES = "ACGTUMRWSYKVHDBNacgtumrwsykvhdbn"
+COMPLEMENT = "TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn"
+BYTES_COMPLEMENT = bytes.maketrans(BASES.encode(), COMPLEMENT.encode())
+STR_COMPLEMENT = str.maketrans(BASES, COMPLEMENT)
+
+PHRED33 = bytes((i+33) & 0xff for i in range(256))
+
+Record = collections.namedtuple("Record", ["name", "seq", "qual", "rq"])
+Record.__new__.__defaults__ = (None, None)
+
+
+def open_file(file, suffix):
+    '''Open a fasta/fastq file in binary mode'''
+
+    if file.endswith(".gz"):
+        fp = gzip.open(file, "rb")
+    elif file.endswith(suffix):
+        fp = open(file, "rb")
+    else:
+        raise Exception("%r file format error" % file)
+
+    return fp
+
+
+def read_blocks(fp, sep, size=CHUNK_SIZE):
+    '''Cut a binary stream into (buffer, start, end) blocks split before sep'''
+
+    tail = b""
+
+    while True:
+        chunk = fp.read(size)
+        if not chunk:
+            break
+        buf = tail + chunk if tail else chunk
+        start = 0
+        end = buf.find(sep)
+
+        while end >= 0:
+            yield buf, start, end
+            start = end + 1
+            end = buf.find(sep, start)
+        tail = buf[start:]
+
+    if tail:
+        yield tail, 0, len(tail)
+
+
+def get_seqid(header):
+
+    seqid = header.split(None, 1)
+
+    if not seqid:
+        return ""
+
+    return seqid[0].lstrip(b">").decode("utf-8")
+
+
+def read_fasta(file, size=CHUNK_SIZE):
+    '''Read fasta file'''
+
+    fp = open_file(file, FASTA_SUFFIX)
+
+    for buf, start, end in read_blocks(fp, b"\n>", size):
+        view = memoryview(buf)
+        line = buf.find(b"\n", start, end)
+        if line < 0:
+            line = end
+        seqid = get_seqid(bytes(view[start:line]))
+        if not seqid:
+            continue
+
+        seq = bytes(view[line+1:end]).translate(None, b"\r\n \t")
+        yield Record(seqid, seq.decode("utf-8"))
+
+    fp.close()
+
+
+def read_fastq(file, size=CHUNK_SIZE):
+    '''Read fastq file'''
+
+    fp = open_file(file, FASTQ_SUFFIX)
+    tail = b""
+
+    while True:
+        chunk = fp.read(size)
+        buf = tail + chunk if tail else chunk
+        if not buf:
+            break
+
+        lines = buf.split(b"\n")
+        tail = lines.pop() if chunk else b""
+        if b"\r" in buf:
+            lines = [line.rstrip(b"\r") for line in lines]
+
+        i = 0
+        n = len(lines)
+        while i < n:
+            if not lines[i].strip():
+                i += 1
+                continue
+            if i + 4 > n:
+                break
+            if lines[i][:1] != b"@":
+                raise Exception("%r file format error, bad record %r" % (file, lines[i]))
+            yield Record(get_seqid(lines[i][1:]), lines[i+1].decode("utf-8"), lines[i+3].decode("utf-8"))
+            i += 4
+
+        if i < n:
+            tail = b"\n".join(lines[i:] + [tail])
+        if not chunk:
+            break
+
+    fp.close()
+
+
+def open_bam(file, threads=1, filter=None):
+    '''Open a bam/sam file, threads are used for bgzf decompression
+
+    filter is an htslib filter expression, e.g. "[rq]>=0.99", records
+    that fail it are skipped inside htslib.
+    '''
+
+    import pysam  # only the bam/sam readers need pysam
+
+    options = []
+    if filter:
+        options.append(("filter=%s" % filter).encode())
+
+    if file.endswith(".bam"):
+        fh = pysam.AlignmentFile(file, "rb", check_sq=False, threads=threads, format_options=options)
+    elif file.endswith(".sam"):
+        fh = pysam.AlignmentFile(file, 'r', threads=threads, format_options=options)
+    else:
+        raise Exception("%r file format error" % file)
+
+    return fh
+
+
+def open_output_bam(file, template, threads=1, level=None):
+    '''Open a bam file for writing, level is the bgzf compression level (0-9)'''
+
+    import pysam
+
+    options = []
+
+    if level is not None:
+        options.append(("level=%d" % level).encode())
+
+    return pysam.AlignmentFile(file, "wb", template=template, threads=threads,
+        format_options=options)
+
+
+def read_bam(file, quality=True, threads=1):
+    '''Read bam/sam file, quality and rq are None when absent'''
+
+    import pysam
+
+    fh = open_bam(file, threads)
+
+    for line in fh:
+        qual = None
+        rq = None
+        if quality and line.query_qualities is not None:
+            qual = pysam.array_to_qualitystring(line.query_qualities)
+        if line.has_tag("rq"):
+            rq = line.get_tag("rq")
+        yield Record(line.query_name, line.query_sequence, qual, rq)
+
+    fh.close()
+
+
+def read_lengths(file, threads=1, filter=None):
+    '''Yield the read lengths of a file, bam/sam sequences are not decoded'''
+
+    if not file.endswith(BAM_SUFFIX):
+        if filter:
+            LOG.warning("%s: the filter only applies to bam/sam input" % file)
+        for line in read_reads(file, quality=False):
+            yield len(line.seq)
+        return
+
+    fh = open_bam(file, threads, filter)
+
+    for line in fh:
+        yield line.query_length
+
+    fh.close()
+
+
+def read_batches(fh, size=BATCH_SIZE, bases=BATCH_BASES):
+    '''Yield the records of an open bam file as lists of up to size records or about bases bases'''
+
+    batch = []
+    length = 0
+
+    for line in fh:
+        batch.append(line)
+        length += line.query_length
+        if len(batch) >= size or length >= bases:
+            yield batch
+            batch = []
+            length = 0
+
+    if batch:
+        yield batch
+
+
+def read_reads(file, quality=True, threads=1):
+    '''Read fasta, fastq, bam or sam file by suffix'''
+
+    if file.endswith(FASTA_SUFFIX):
+        fh = read_fasta(file)
+    elif file.endswith(FASTQ_SUFFIX):
+        fh = read_fastq(file)
+    elif file.endswith(BAM_SUFFIX):
+        fh = read_bam(file, quality, threads)
+    else:
+        raise Exception("%r file format error" % file)
+
+    return fh
+
+
+class GzipWriter(gzip.GzipFile):
+    '''A GzipFile that also closes the file object it writes to'''
+
+    def close(self):
+
+        fp = self.fileobj
+        try:
+            super(GzipWriter, self).close()
+        finally:
+            if fp is not None:
+                fp.close()
+
+
+def open_output(file=None, compress=None, level=6, threads=1):
+    '''Open a buffered binary output, stdout when file is None or "-"
+
+    compress is None, "gzip" or "bgzip", bgzip blocks are compressed
+    with threads threads.
+    '''
+
+    if file is None or file == "-":
+        sys.stdout.flush()
+        fp = io.FileIO(sys.stdout.fileno(), "wb", closefd=False)
+    else:
+        fp = io.FileIO(file, "wb")
+    fp = io.BufferedWriter(fp, CHUNK_SIZE)
+
+    if compress == "gzip":
+        return GzipWriter(fileobj=fp, mode="wb", compresslevel=level)
+    elif compress == "bgzip":
+        from compress import BgzfWriter
+        return BgzfWriter(fp, level, threads)
+    elif compress:
+        raise Exception("%r compression is not supported" % compress)
+
+    return fp
+
+
+def reverse_complement(seq):
+    '''Return the reverse complement of a str or bytes sequence, other characters are kept'''
+
+    if isinstance(seq, (bytes, bytearray, memoryview)):
+        return bytes(seq).translate(BYTES_COMPLEMENT)[::-1]
+
+    return seq.translate(STR_COMPLEMENT)[::-1]
+
+
+def encode_fastq(records, comments=None, reverse=None):
+    '''Format a batch of bam records as fastq bytes
+
+    The records flagged in reverse are written reverse complemented.
+    '''
+
+    data = []
+
+    for i, line in enumerate(records):
+        name = line.query_name
+        if comments:
+            name = "%s %s" % (name, comments[i])
+        seq = (line.query_sequence or "").encode()
+        qual = line.query_qualities
+        qual = (bytes(line.query_length) if qual is None else qual.tobytes()).translate(PHRED33)
+        if reverse and reverse[i]:
+            seq = reverse_complement(seq)
+            qual = qual[::-1]
+        # joined once per batch, formatting every read would copy it once more
+        data.extend((b"@", name.encode(), b"\n", seq, b"\n+\n", qual, b"\n"))
+
+    return b"".join(data)
+
+
+def encode_fasta(records, reverse=None):
+    '''Format a batch of bam records as fasta bytes, the records flagged in reverse reverse complemented'''
+
+    data = []
+
+    for i, line in enumerate(records):
+        seq = (line.query_sequence or "").encode()
+        if reverse and reverse[i]:
+            seq = reverse_complement(seq)
+        data.extend((b">", line.query_name.encode(), b"\n", seq, b"\n"))
+
+    return b"".join(data)
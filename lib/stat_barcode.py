@@ -5,12 +5,17 @@ import os
 import re
 import sys
 import json
-import gzip
-import pysam
 import logging
 import argparse
 
 import collections
+from functools import partial
+
+from seqio import read_lengths
+from parallel import map_jobs
+from histogram import length_stat, LengthStat
+from statcache import load_stat, save_stat
+from runstats import timed, count, add_stats_args, run_main
 
 LOG = logging.getLogger(__name__)
 
@@ -20,140 +25,51 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_fasta(file):
-    '''Read fasta file'''
-
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fasta") or file.endswith(".fa"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = ''
-
-    for line in fp:
-        line = line.strip()
-
-        if not line:
-            continue
-        if not seq:
-            seq += "%s\n" % line.strip(">").split()[0]
-            continue
-        if line.startswith(">"):
-            line = line.strip(">").split()[0]
-            seq = seq.split('\n')
-
-            yield [seq[0], seq[1]]
-            seq = ''
-            seq += "%s\n" % line
-        else:
-            seq += line
-
-    seq = seq.split('\n')
-    if len(seq)==2:
-        yield [seq[0], seq[1]]
-    fp.close()
-
-
-def read_fastq(file):
-    '''Read fastq file'''
-
-    if file.endswith(".gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fastq") or file.endswith(".fq"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = []
-
-    for line in fp:
-        line = line.strip()
-
-        if not line:
-            continue
-        if line.startswith('@') and (len(seq)==0 or len(seq)>=5):
-            seq.append(line.strip("@").split()[0])
-            continue
-        if line.startswith('@') and len(seq)==4:
-            yield seq
-            seq = []
-            seq.append(line.strip("@").split()[0])
-        else:
-            seq.append(line)
-
-    if len(seq)==4:
-        yield seq
-    fp.close()
-
-
-def read_bam(file):
+def read_length(file, threads=1, filter=None, cache=True):
 
-    if file.endswith(".bam"):
-        fh = pysam.AlignmentFile(file, "rb", check_sq=False)
-    elif file.endswith(".sam"):
-        fh = pysam.AlignmentFile(file, 'r')
-    else:
-        raise Exception("%r file format error" % file)
-
-    for line in fh:
-        yield [line.qname, line.seq]
-
-    fh.close()
+    version = "%s %s" % (__version__, filter or "")
+    data = None
 
+    if cache:
+        data = load_stat(file, "stat_barcode", version)
+    if data is not None:
+        return LengthStat.from_arrays(data)
 
-def n50(lengths):
+    stat = length_stat(timed(read_lengths(file, threads, filter)))
+    if cache:
+        save_stat(file, "stat_barcode", version, stat.to_arrays())
 
-    sum_length = sum(lengths)
-    accu_length = 0
+    return stat
 
-    for i in sorted(lengths, reverse=True):
-        accu_length += i
 
-        if accu_length >= sum_length*0.5:
-            return i
+def stat_file(file, threads=1, filter=None, cache=True):
 
+    name = file.split('/')[-1]
 
-def read_length(file):
-
-    length = []
-
-    if file.endswith(".fasta") or file.endswith(".fa") or file.endswith(".fa.gz") or file.endswith(".fasta.gz"):
-        fh = read_fasta(file)
-    elif file.endswith(".fastq") or file.endswith(".fq") or file.endswith(".fq.gz") or file.endswith(".fastq.gz"):
-        fh = read_fastq(file)
-    elif file.endswith(".bam") or file.endswith(".sam"):
-        fh = read_bam(file)
+    if '--' in name:
+        name = name.split('--')[1].split('.bam')[0]
     else:
-        raise Exception("%r file format error" % file)
-
-    for line in fh:
-        length.append(len(line[1]))
+        name = name.split('.')[0]
+    count(files=[file])
+    stat = read_length(file, threads, filter, cache)
 
-    return length
+    return [name, stat.bases, stat.number, stat.mean(), stat.nx(50), stat.longest, stat.nx(10), stat.nx(90)]
 
 
-def stat_reads(files, out):
+def stat_reads(files, out, threads=1, jobs=1, filter=None, cache=True):
 
-    title = ["Sample", "Bases(bp)", "Reads number", "Mean Length(bp)", "N50(bp)", "Longest(bp)"]
+    title = ["Sample", "Bases(bp)", "Reads number", "Mean Length(bp)", "N50(bp)", "Longest(bp)", "N10(bp)", "N90(bp)"]
     data = collections.OrderedDict()
     sample = collections.OrderedDict()
     fo = open(out, 'w')
-    fo.write('Sample\tBases(bp)\tReads number\tMean Length(bp)\tN50(bp)\tLongest(bp)\n')
-    for file in files:
-        name = file.split('/')[-1]
-
-        if '--' in name:
-            name = name.split('--')[1].split('.bam')[0]
-        else:
-            name = name.split('.')[0]
+    fo.write('Sample\tBases(bp)\tReads number\tMean Length(bp)\tN50(bp)\tLongest(bp)\tN10(bp)\tN90(bp)\n')
+    for line in map_jobs(partial(stat_file, threads=threads, filter=filter, cache=cache), files, jobs):
+        name = line[0]
         data[name] = collections.OrderedDict()
         sample[name] = [name, "", ""]
-        length = read_length(file)
 
-        fo.write('{0}\t{1:,}\t{2:,}\t{3:,.2f}\t{4:,}\t{5:,}\n'.format(name, sum(length), len(length), sum(length)*1.0/len(length), n50(length), max(length)))
-        line = [name, sum(length), len(length), round(sum(length)*1.0/len(length), 2), n50(length), max(length)]
+        fo.write('{0}\t{1:,}\t{2:,}\t{3:,.2f}\t{4:,}\t{5:,}\t{6:,}\t{7:,}\n'.format(*line))
+        line[3] = round(line[3], 2)
         for i in range(len(title)-1):
             data[name][title[i+1]] = line[i+1]
     fo.close()
@@ -168,6 +84,14 @@ def add_hlep_args(parser):
         help='Input reads file, format(fasta,fastq,fa.gz,bam and sam).')
     parser.add_argument('-o', '--out', metavar='STR', type=str, default="out.tsv",
         help='Out name')
+    parser.add_argument('-t', '--threads', metavar='INT', type=int, default=1,
+        help='Threads used for bam decompression, default=1.')
+    parser.add_argument('-j', '--jobs', metavar='INT', type=int, default=1,
+        help='Number of samples processed in parallel, default=1.')
+    parser.add_argument('-f', '--filter', metavar='STR', type=str, default=None,
+        help='htslib filter expression for bam/sam input, e.g. "[rq]>=0.99".')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+        help='Do not read or write the file.sbstat statistics cache.')
 
     return parser
 
@@ -188,13 +112,14 @@ attention:
     stat_barcode.py -i *.bam
     stat_barcode.py -i *.fa
     stat_barcode.py -i *.fq
+    stat_barcode.py -i *.bam --filter '[rq]>=0.99'
 version: %s
 contact:  %s <%s>\
         ''' % (__version__, ' '.join(__author__), __email__))
 
-    args = add_hlep_args(parser).parse_args()
+    args = add_stats_args(add_hlep_args(parser)).parse_args()
 
-    stat_reads(args.input, args.out)
+    run_main(lambda: stat_reads(args.input, args.out, args.threads, args.jobs, args.filter, args.cache), args, "stat_barcode")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import os
+import logging
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["load_stat", "save_stat"]
+
+
+CACHE_SUFFIX = ".sbstat"
+
+
+def file_key(file):
+    '''Return the (path, size, mtime) the cache of a file is valid for'''
+
+    stat = os.stat(file)
+
+    return os.path.abspath(file), stat.st_size, stat.st_mtime
+
+
+def read_cache(file):
+    '''Return all arrays of the sidecar cache of file, {} when missing or stale'''
+
+    cache = file + CACHE_SUFFIX
+
+    if not os.path.exists(cache):
+        return {}
+
+    try:
+        with np.load(cache, allow_pickle=False) as fp:
+            data = dict((key, fp[key]) for key in fp.files)
+    except Exception as error:
+        LOG.warning("cannot read statistics cache %s: %s" % (cache, error))
+        return {}
+
+    path, size, mtime = file_key(file)
+    if str(data.get("path")) != path or int(data.get("size", -1)) != size or float(data.get("mtime", -1)) != mtime:
+        LOG.info("%s is stale, ignored" % cache)
+        return {}
+
+    return data
+
+
+def load_stat(file, tool, version):
+    '''Return the cached arrays of tool for file, None when missing or made by another version'''
+
+    data = read_cache(file)
+    prefix = "%s." % tool
+
+    if str(data.get(prefix + "version")) != version:
+        return None
+
+    LOG.info("reading %s statistics of %s from cache" % (tool, file))
+    return dict((key[len(prefix):], data[key]) for key in data
+        if key.startswith(prefix) and key != prefix + "version")
+
+
+def save_stat(file, tool, version, arrays):
+    '''Store the arrays of tool in the sidecar cache file.sbstat, keeping other tools' entries'''
+
+    data = read_cache(file)
+    path, size, mtime = file_key(file)
+    prefix = "%s." % tool
+
+    for key in list(data):
+        if key.startswith(prefix):
+            del data[key]
+    for key in arrays:
+        data[prefix + key] = arrays[key]
+    data[prefix + "version"] = np.array(version)
+    data.update(path=np.array(path), size=np.array(size), mtime=np.array(mtime))
+
+    cache = file + CACHE_SUFFIX
+    temp = "%s.%d.tmp" % (cache, os.getpid())
+    try:
+        with open(temp, "wb") as fp:
+            np.savez_compressed(fp, **data)
+        os.rename(temp, cache)
+    except (IOError, OSError) as error:
+        LOG.warning("cannot write statistics cache %s: %s" % (cache, error))
+        if os.path.exists(temp):
+            os.remove(temp)
+        return None
+
+    return cache
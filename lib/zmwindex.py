@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import array
+import logging
+
+import collections
+import numpy as np
+
+from bisect import bisect_left
+
+LOG = logging.getLogger(__name__)
+
+__version__ = "1.0.0"
+__author__ = ("Xingguo Zhang",)
+__email__ = "113178210@qq.com"
+__all__ = ["parse_zmw", "build_zmw_index", "has_zmw", "select_zmws", "index_holes", "index_size",
+    "build_zmw_map", "map_sample", "select_zmw_samples"]
+
+
+def parse_zmw(name):
+    '''Split a pacbio read name movie/hole/... into (movie, hole)'''
+
+    fields = name.split('/', 2)
+
+    try:
+        return fields[0], int(fields[1])
+    except (IndexError, ValueError):
+        raise Exception("%r is not a pacbio read name (movie/zmw/...)" % name)
+
+
+def build_zmw_index(names):
+    '''Build {movie: bitmap of zmw hole numbers} from read names'''
+
+    holes = collections.defaultdict(lambda: array.array('l'))
+
+    for name in names:
+        movie, hole = parse_zmw(name)
+        holes[movie].append(hole)
+
+    index = {}
+    for movie in holes:
+        hole = np.frombuffer(holes[movie], dtype=np.int_)
+        # set the bits in place, a bool array per hole number would be 8 times larger
+        bits = np.zeros((hole.max() >> 3) + 1, dtype=np.uint8)
+        np.bitwise_or.at(bits, hole >> 3, np.left_shift(1, hole & 7).astype(np.uint8))
+        index[movie] = bits.tobytes()
+        LOG.debug("%s: %d zmws, %d bytes" % (movie, len(hole), len(index[movie])))
+
+    return index
+
+
+def has_zmw(index, name):
+    '''Return True if the zmw of read name is in the index'''
+
+    movie, hole = parse_zmw(name)
+    bits = index.get(movie)
+
+    if bits is None or (hole >> 3) >= len(bits):
+        return False
+
+    return bool(bits[hole >> 3] & (1 << (hole & 7)))
+
+
+def zmw_prefix(name):
+    '''Return the movie/zmw part of a read name'''
+
+    i = name.find('/', name.find('/')+1)
+
+    if i < 0:
+        return name
+
+    return name[:i]
+
+
+def select_zmws(index, records):
+    '''Yield the bam records whose zmw is in the index
+
+    Subreads of a zmw are adjacent, so the lookup is only done when the
+    movie/zmw prefix of the read name changes.
+    '''
+
+    last = None
+    keep = False
+
+    for record in records:
+        name = record.query_name
+        zmw = zmw_prefix(name)
+        if zmw != last:
+            last = zmw
+            keep = has_zmw(index, name)
+        if keep:
+            yield record
+
+
+def index_holes(index, movie):
+    '''Return the sorted zmw hole numbers of a movie as an int64 array'''
+
+    bits = np.frombuffer(index[movie], dtype=np.uint8)
+
+    return np.flatnonzero(np.unpackbits(bits, bitorder="little")).astype(np.int64)
+
+
+def index_size(index):
+    '''Return the number of zmws in the index'''
+
+    return sum(int(np.unpackbits(np.frombuffer(index[movie], dtype=np.uint8)).sum()) for movie in index)
+
+
+def build_zmw_map(samples):
+    '''Build {movie: (sorted zmw hole numbers, sample numbers)} from read names
+
+    samples is a list of read name iterables, the zmws of samples[i] get
+    number i+1. Both are arrays of the mapped zmws only, so the map size
+    follows the number of zmws and not the largest hole number.
+    '''
+
+    holes = collections.defaultdict(lambda: [array.array('l'), array.array('H')])
+
+    for i, names in enumerate(samples):
+        for name in names:
+            movie, hole = parse_zmw(name)
+            holes[movie][0].append(hole)
+            holes[movie][1].append(i+1)
+
+    zmw_map = {}
+    for movie in holes:
+        hole = np.frombuffer(holes[movie][0], dtype=np.int_).astype(np.int64)
+        number = np.frombuffer(holes[movie][1], dtype=np.uint16).astype(np.int64)
+        pairs = np.unique((hole << 16) | number)
+        # pairs are sorted by zmw then sample, keep the first sample of a zmw
+        hole, first = np.unique(pairs >> 16, return_index=True)
+        repeat = len(pairs) - len(hole)
+        if repeat:
+            LOG.warning("%s: %d zmws found in several samples, the first one is kept" % (movie, repeat))
+        zmw_map[movie] = (array.array('l', hole.astype(np.int_).tobytes()),
+            array.array('H', (pairs[first] & 0xffff).astype(np.uint16).tobytes()))
+
+    return zmw_map
+
+
+def map_sample(zmw_map, movie, hole):
+    '''Return the sample number of a zmw, 0 when it is not mapped'''
+
+    entry = zmw_map.get(movie)
+    if entry is None:
+        return 0
+
+    holes, ids = entry
+    i = bisect_left(holes, hole)
+    if i < len(holes) and holes[i] == hole:
+        return ids[i]
+
+    return 0
+
+
+def select_zmw_samples(zmw_map, records):
+    '''Yield (sample number, record) for the bam records of a mapped zmw'''
+
+    last = None
+    number = 0
+
+    for record in records:
+        name = record.query_name
+        zmw = zmw_prefix(name)
+        if zmw != last:
+            last = zmw
+            movie, hole = parse_zmw(name)
+            number = map_sample(zmw_map, movie, hole)
+        if number:
+            yield number, record
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#coding:utf-8
+
+import io
+import os
+import sys
+import gzip
+import array
+import shutil
+import random
+import tempfile
+import unittest
+
+import pysam
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+import rawbam
+from rawbam import is_record, split_bam
+from compress import BgzfWriter
+from bamindex import index_records, range_records
+
+
+HEADER = {"HD": {"VN": "1.5", "SO": "unknown"}, "SQ": [{"SN": "chr1", "LN": 100000}]}
+
+
+def make_record(header, name, length, rng, tags=()):
+    '''Return an unmapped pacbio-like record with random bases, qualities and ip/pw kinetics'''
+
+    record = pysam.AlignedSegment(header)
+    record.query_name = name
+    record.flag = 4
+    record.query_sequence = "".join(rng.choice("ACGT") for i in range(length))
+    record.query_qualities = pysam.qualitystring_to_array("".join(chr(rng.randint(33, 126)) for i in range(length)))
+    record.set_tags([
+        ("ip", [rng.randint(0, 255) for i in range(length)], "C"),
+        ("pw", [rng.randint(0, 255) for i in range(length)], "C"),
+        ("rq", 0.99, "f")] + list(tags))
+
+    return record
+
+
+def write_bam(file, records, header):
+
+    with pysam.AlignmentFile(file, "wb", header=header) as fo:
+        for record in records:
+            fo.write(record)
+
+
+def bam_stream(file):
+    '''Return the uncompressed (header, records) bytes of a bam file'''
+
+    with gzip.open(file, "rb") as fh:
+        data = fh.read()
+
+    start = 8 + rawbam.INT32.unpack_from(data, 4)[0]
+    n_ref = rawbam.INT32.unpack_from(data, start)[0]
+    start += 4
+    for i in range(n_ref):
+        start += 8 + rawbam.INT32.unpack_from(data, start)[0]
+
+    return data[:start], data[start:]
+
+
+def rewrite_blocks(file, output):
+    '''Compress the bam stream of file again in BgzfWriter blocks, which are cut inside records'''
+
+    header, records = bam_stream(file)
+    fo = BgzfWriter(io.open(output, "wb"), 1)
+    fo.write(header + records)
+    fo.close()
+
+
+def read_names(file, start=None, end=None):
+
+    with pysam.AlignmentFile(file, "rb", check_sq=False) as fh:
+        return [i.query_name for i in range_records(fh, start, end)]
+
+
+class RawBamTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.mkdtemp(prefix="rawbam_test.")
+        self.header = pysam.AlignmentHeader.from_dict(HEADER)
+        self.rng = random.Random(1)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+
+        return os.path.join(self.tmp, name)
+
+    def test_split_without_index(self):
+
+        records = [make_record(self.header, "m/%d/0_1" % i, self.rng.randint(500, 20000), self.rng)
+            for i in range(60)]
+        write_bam(self.path("a.bam"), records, self.header)
+        rewrite_blocks(self.path("a.bam"), self.path("b.bam"))
+        names = [i.query_name for i in records]
+
+        parts = split_bam(self.path("b.bam"), 7)
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(any(start & 0xffff for start, end in parts if start is not None))
+        self.assertEqual(sum([read_names(self.path("b.bam"), start, end) for start, end in parts], []), names)
+
+    def test_split_at_zmws(self):
+
+        records = []
+        for zmw in range(40):
+            for i in range(self.rng.randint(1, 5)):
+                records.append(make_record(self.header, "m/%d/%d_%d" % (zmw, i*100, i*100+50),
+                    self.rng.randint(100, 3000), self.rng))
+        write_bam(self.path("a.bam"), records, self.header)
+        rewrite_blocks(self.path("a.bam"), self.path("b.bam"))
+
+        with pysam.AlignmentFile(self.path("b.bam"), "rb", check_sq=False) as fh:
+            self.assertEqual(len(list(index_records(fh, self.path("b.bam")))), len(records))
+        with np.load(self.path("b.bam.zmi")) as fh:
+            offsets = fh["offset"]
+        self.assertEqual(len(offsets), 40)
+
+        parts = split_bam(self.path("b.bam"), 4, offsets)
+        self.assertEqual(len(parts), 4)
+        result = [read_names(self.path("b.bam"), start, end) for start, end in parts]
+        self.assertEqual(sum(result, []), [i.query_name for i in records])
+        for part in result[1:]:
+            # a part starts with the first subread of a zmw
+            self.assertTrue(part[0].endswith("/0_50"))
+
+    def test_is_record_rejects_false_starts(self):
+
+        records = [make_record(self.header, "m/%d/0_1" % i, self.rng.randint(200, 2000), self.rng)
+            for i in range(30)]
+        write_bam(self.path("a.bam"), records, self.header)
+        data = bam_stream(self.path("a.bam"))[1]
+
+        starts = set()
+        start = 0
+        while start < len(data):
+            starts.add(start)
+            start += 4 + rawbam.INT32.unpack_from(data, start)[0]
+
+        for start in range(len(data)):
+            self.assertEqual(is_record(data, start, 1), start in starts, start)
+
+    def test_is_record_rejects_records_in_kinetics(self):
+
+        # five whole records hidden in a kinetics array look like a record
+        # chain, but it falls out of step where the array ends
+        fake = [make_record(self.header, "m/%d/0_1" % i, 40, self.rng) for i in range(5)]
+        write_bam(self.path("fake.bam"), fake, self.header)
+        hidden = bam_stream(self.path("fake.bam"))[1]
+        record = make_record(self.header, "m/100/0_1", 300, self.rng)
+        record.set_tag("ip", array.array("B", bytearray(hidden) + bytearray([7]*33)))
+        records = [make_record(self.header, "m/99/0_1", 300, self.rng), record,
+            make_record(self.header, "m/101/0_1", 300, self.rng)]
+        write_bam(self.path("a.bam"), records, self.header)
+        data = bam_stream(self.path("a.bam"))[1]
+
+        inner = data.find(hidden)
+        self.assertGreater(inner, 0)
+        self.assertTrue(is_record(hidden, 0, 1))
+        self.assertFalse(is_record(data, inner, 1))
+        self.assertTrue(is_record(data, 0, 1))
+
+
+if __name__ == "__main__":
+
+    unittest.main()